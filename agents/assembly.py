@@ -1,48 +1,156 @@
 import os
 import json
 from agents.base import BaseAgent
-from utils.google_api import generate_text
+from agents import schemas
+from utils.audio import duration_sec
+from utils.structured import validate
+
+# timeline.json is built locally: audio chunks back to back at the length of
+# the synthesized files, and each segment's visual slots sharing the time its
+# narration actually takes. No model call is involved.
+
+# Narration pace assumed for a segment whose audio could not be measured
+WORDS_PER_SEC = 2.5
+FRAME_RATE = 30
+RESOLUTION = {"width": 1920, "height": 1080}
 
 class VideoAssemblyAgent(BaseAgent):
+    # 'images' makes assembly wait for the real image paths from production
+    inputs = ('structure', 'image_prompts', 'tts_plan', 'images')
+    outputs = ('timeline',)
+
     def run(self, context):
         print("--- Starting Video Assembly Agent ---")
         structure = context.get('structure')
         image_prompts = context.get('image_prompts')
         tts_plan = context.get('tts_plan')
-        
+
         if not structure or not image_prompts or not tts_plan:
             print("ERROR: Missing upstream data for Assembly Agent")
             return context
-            
-        system_prompt = self.load_prompt('video_assembly_agent.md')
-        
-        input_data = {
-            "structure": structure,
-            "image_prompts": image_prompts,
-            "tts_plan": tts_plan
-        }
-        
-        input_str = json.dumps(input_data, indent=2, default=str)
-        
-        response = generate_text(
-            system_prompt=system_prompt,
-            user_prompt=f"Create a video timeline plan:\n{input_str}",
-            model_key="text_main"
-        )
-        
-        if "```json" in response:
-            response = response.split("```json")[1].split("```")[0].strip()
-        elif "```" in response:
-            response = response.split("```")[1].split("```")[0].strip()
-            
-        try:
-            timeline = json.loads(response)
-            context['timeline'] = timeline
-            
-            with open(os.path.join(context['paths']['root'], 'timeline.json'), 'w') as f:
-                json.dump(timeline, f, indent=2)
-                
-        except json.JSONDecodeError:
-            print("ERROR: Failed to parse JSON from Assembly Agent")
-            
+
+        root = context['paths']['root']
+        timeline = build_timeline(structure, tts_plan, context.get('images') or {}, root)
+        for problem in validate(timeline, schemas.TIMELINE)[:5]:
+            print(f"WARNING: Timeline: {problem}")
+
+        context['timeline'] = timeline
+
+        with open(os.path.join(root, 'timeline.json'), 'w') as f:
+            json.dump(timeline, f, indent=2)
         return context
+
+def _relative(path, root):
+    """Path relative to the episode root when it lies inside it (the renderer resolves both)."""
+    rel = os.path.relpath(os.path.abspath(path), os.path.abspath(root))
+    return path if rel.startswith('..') else rel
+
+def _find_asset(root, kind, name, extensions):
+    for ext in extensions:
+        candidate = os.path.join(root, 'assets', kind, name + ext)
+        if name and os.path.exists(candidate):
+            return candidate
+    return None
+
+def _audio_path(chunk, root):
+    path = chunk.get('absolute_path')
+    if path and os.path.exists(path):
+        return path
+    name = os.path.splitext(os.path.basename(chunk.get('output_file') or ''))[0]
+    return _find_asset(root, 'audio', name, ('.wav', '.mp3'))
+
+def _image_path(slot_id, images, root):
+    path = images.get(slot_id)
+    if path and os.path.exists(path):
+        return path
+    return _find_asset(root, 'images', slot_id, ('.png', '.jpg', '.jpeg', '.webp'))
+
+def _planned(item):
+    return float(item.get('end_time_sec') or 0) - float(item.get('start_time_sec') or 0)
+
+def _chunks_by_segment(segments, chunks):
+    """Audio chunks grouped under structure segments; unknown ids stay with the chunk before them."""
+    grouped = {seg.get('id'): [] for seg in segments}
+    current = segments[0].get('id') if segments else None
+    for chunk in chunks:
+        if chunk.get('segment_id') in grouped:
+            current = chunk['segment_id']
+        if current is not None:
+            grouped[current].append(chunk)
+    return grouped
+
+def build_timeline(structure, tts_plan, images, root):
+    """
+    The timeline for an episode from its structure, TTS plan, generated
+    images and the audio/image files under root. Times are rounded to milliseconds.
+    """
+    segments = structure.get('segments', [])
+    grouped = _chunks_by_segment(segments, tts_plan.get('audio_chunks', []))
+
+    video = []
+    audio = []
+    cursor = 0.0
+    unplaced_from = None  # start of time no clip has covered yet
+    for seg in segments:
+        seg_start = cursor
+        for chunk in grouped.get(seg.get('id'), []):
+            path = _audio_path(chunk, root)
+            # Measured by the voice-over stage, or here if it ran in another process
+            seconds = (chunk.get('duration_sec') or duration_sec(path)) if path else None
+            if not seconds:
+                # The renderer skips missing audio, so it takes no time here either
+                print(f"WARNING: No readable audio for {chunk.get('chunk_id')}; left out of the timeline")
+                continue
+            audio.append({
+                "chunk_id": chunk.get('chunk_id'),
+                "audio_file": _relative(path, root),
+                "start_time_sec": round(cursor, 3),
+                "end_time_sec": round(cursor + seconds, 3),
+                "duck_under_other_audio": False,
+            })
+            cursor += seconds
+
+        if cursor == seg_start:
+            # No narration: keep the planned length (or an estimate) on screen
+            planned = _planned(seg) or len(" ".join(c.get('text') or '' for c in grouped.get(seg.get('id'), [])).split()) / WORDS_PER_SEC
+            cursor += planned
+            print(f"WARNING: Segment {seg.get('id')} has no measured audio; using {planned:.1f}s")
+
+        slots = [(slot, _image_path(slot.get('slot_id'), images, root))
+                 for slot in seg.get('visual_slots', [])]
+        slots = [(slot, path) for slot, path in slots if path]
+        if not slots:
+            # Nothing to show: the previous (or next) image holds through this segment
+            if video:
+                video[-1]['end_time_sec'] = round(cursor, 3)
+            elif unplaced_from is None:
+                unplaced_from = seg_start
+            continue
+
+        start = unplaced_from if unplaced_from is not None else seg_start
+        unplaced_from = None
+        weights = [max(_planned(slot), 0.0) or 1.0 for slot, _ in slots]
+        total = sum(weights)
+        done = 0.0
+        for i, ((slot, path), weight) in enumerate(zip(slots, weights)):
+            clip_start = start if i == 0 else seg_start + (cursor - seg_start) * done / total
+            done += weight
+            clip_end = cursor if i == len(slots) - 1 else seg_start + (cursor - seg_start) * done / total
+            video.append({
+                "slot_id": slot.get('slot_id'),
+                "segment_id": seg.get('id'),
+                "image_file": _relative(path, root),
+                "start_time_sec": round(clip_start, 3),
+                "end_time_sec": round(clip_end, 3),
+                "transition_in": "fade" if i == 0 else "cut",
+                "transition_out": "cut",
+            })
+
+    print(f"Timeline: {len(video)} clips, {len(audio)} audio chunks, {cursor:.1f}s total")
+    return {
+        "episode_id": structure.get('episode_id'),
+        "frame_rate": FRAME_RATE,
+        "resolution": RESOLUTION,
+        "total_duration_sec": round(cursor, 3),
+        "tracks": {"video": video, "audio": audio},
+    }
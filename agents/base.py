@@ -1,14 +1,176 @@
 import yaml
 import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils import compact
+from utils.context_cache import expect_reuse
+from utils.tracing import current_span, run_in_context
+
+# Stages of the same episode can finish at the same time; serialize
+# updates to the run manifest.
+_MANIFEST_LOCK = threading.Lock()
+MANIFEST_FILE = "stage_cache.json"
 
 class BaseAgent:
+    # Context keys this agent reads and writes. The pipeline uses them to
+    # work out which stages can run at the same time.
+    inputs = ()
+    outputs = ()
+    # Outputs this agent also publishes element by element while running, and
+    # inputs it can consume that way (see agents.pipeline.ElementStream).
+    streams = ()
+    stream_inputs = ()
+
+    # Output key -> file under the episode root holding it. Stages listing
+    # artifacts are memoized: when their fingerprint matches the recorded
+    # run, the outputs are reloaded from disk instead of calling the model.
+    artifacts = {}
+    model_key = "text_main"
+    temperature = 0.7
+    # JSON schema (agents.schemas) the model's answer must follow, if any
+    response_schema = None
+    # Dotted paths of the input fields the prompt actually reads (None sends
+    # everything), and long text fields that may be shortened, in order, to
+    # keep the serialized input within token_budget.
+    input_fields = None
+    trim_fields = ()
+    # Input text many calls share (the episode script). It is sent ahead of
+    # the JSON as shared context, which google_api can serve from a context cache.
+    shared_input = None
+    # Agents whose output is per segment can split the work into one call per
+    # group of segments (see shard_segments and the `sharding` settings).
+    sharded = False
+
     def __init__(self, config):
         self.config = config
+
+    @property
+    def name(self):
+        return self.__class__.__name__
     
     def load_prompt(self, prompt_name):
         path = os.path.join(self.config['paths']['prompts'], prompt_name)
         with open(path, 'r', encoding='utf-8') as f:
             return f.read()
 
+    def fingerprint(self, context, system_prompt):
+        """Hash of everything that determines this stage's LLM output."""
+        payload = {
+            "agent": self.name,
+            "inputs": {key: context.get(key) for key in self.inputs},
+            "system_prompt": system_prompt,
+            "model": self.config['models'].get(self.model_key, self.model_key),
+            "temperature": self.temperature,
+            "response_schema": self.response_schema,
+            "input_fields": self.input_fields,
+            "shared_input": self.shared_input,
+            "token_budget": compact.budget_settings(self.config, self.name),
+            "sharding": self.config.get('sharding') if self.sharded else None,
+            # Mock and fake output must never be reused as a real model's
+            "backend": self.config['runtime'].get('backend', 'genai'),
+            "mock_mode": self.config['runtime'].get('mock_mode', False),
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def serialize_input(self, data):
+        """
+        Compact JSON of data for the user prompt, within this agent's token
+        budget. Returns (json, shared context); the latter is data[shared_input].
+        """
+        max_tokens, chars_per_token = compact.budget_settings(self.config, self.name)
+        text, shared, tokens, baseline = compact.serialize(self.name, data, self.input_fields, self.trim_fields,
+                                                           max_tokens, chars_per_token, self.shared_input)
+        stage = current_span()
+        if stage is not None:
+            stage.add("input_tokens", tokens)
+            stage.add("input_tokens_saved", baseline - tokens)
+        return text, shared
+
+    def shard_segments(self, segments):
+        """
+        Groups of consecutive segments to ask for separately. A single group
+        when sharding is off or the episode has fewer than min_segments.
+        """
+        settings = self.config.get('sharding', {}) or {}
+        if not settings.get('enabled', False) or len(segments) < settings.get('min_segments', 8):
+            return [list(segments)]
+        size = max(1, int(settings.get('segments_per_shard', 2)))
+        return [list(segments[i:i + size]) for i in range(0, len(segments), size)]
+
+    def map_shards(self, fn, shards):
+        """fn(shard) for every shard, run concurrently; results come back in shard order."""
+        if len(shards) == 1:
+            return [fn(shards[0])]
+        workers = max(1, int((self.config.get('sharding', {}) or {}).get('max_parallel', 4)))
+        print(f"{self.name}: {len(shards)} segment shards, up to {workers} at a time")
+        # Every shard sends the same system prompt and script, so that prefix is worth caching up front
+        with expect_reuse(len(shards)), ThreadPoolExecutor(max_workers=min(workers, len(shards))) as executor:
+            futures = [run_in_context(executor, fn, shard) for shard in shards]
+            return [future.result() for future in futures]
+
+    def recall(self, context, fingerprint):
+        """
+        Loads this stage's outputs from disk if the last recorded run had the
+        same fingerprint and its artifacts are untouched. Returns True on a hit.
+        """
+        if not self.artifacts or not self.config['runtime'].get('memoize_stages', True):
+            return False
+
+        root = context['paths']['root']
+        entry = _read_manifest(root).get(self.name)
+        if not entry or entry.get('fingerprint') != fingerprint:
+            return False
+
+        loaded = {}
+        for key, filename in self.artifacts.items():
+            path = os.path.join(root, filename)
+            if not os.path.exists(path) or _file_digest(path) != entry['artifacts'].get(filename):
+                return False
+            with open(path, 'r', encoding='utf-8') as f:
+                loaded[key] = json.load(f) if filename.endswith('.json') else f.read()
+
+        context.update(loaded)
+        print(f"Reusing recorded {self.name} output (inputs unchanged)")
+        return True
+
+    def remember(self, context, fingerprint):
+        """Records the artifacts written by a successful run of this stage."""
+        if not self.artifacts:
+            return
+
+        root = context['paths']['root']
+        digests = {}
+        for filename in self.artifacts.values():
+            path = os.path.join(root, filename)
+            if not os.path.exists(path):
+                return
+            digests[filename] = _file_digest(path)
+
+        with _MANIFEST_LOCK:
+            manifest = _read_manifest(root)
+            manifest[self.name] = {"fingerprint": fingerprint, "artifacts": digests}
+            with open(os.path.join(root, MANIFEST_FILE), 'w') as f:
+                json.dump(manifest, f, indent=2)
+
     def run(self, context):
         raise NotImplementedError
+
+def _read_manifest(root):
+    path = os.path.join(root, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest()
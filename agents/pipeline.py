@@ -0,0 +1,187 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils.tracing import span, run_in_context
+
+
+class StageError(Exception):
+    """Raised when an agent fails inside the pipeline."""
+    def __init__(self, agent_name, error):
+        super().__init__(f"{agent_name}: {error}")
+        self.agent_name = agent_name
+        self.error = error
+
+
+_END = object()
+
+class ElementStream:
+    """
+    Elements of an output published while its producer is still running.
+    Any number of consumers can iterate it (sync or async); each sees every
+    element from the start, and iteration ends when the producer's stage
+    finishes.
+    """
+    def __init__(self):
+        self._items = []
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def publish(self, item):
+        with self._cond:
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def published(self):
+        with self._cond:
+            return list(self._items)
+
+    def _get(self, index):
+        with self._cond:
+            while index >= len(self._items) and not self._closed:
+                self._cond.wait()
+            if index < len(self._items):
+                return self._items[index]
+            return _END
+
+    def __iter__(self):
+        index = 0
+        while True:
+            item = self._get(index)
+            if item is _END:
+                return
+            index += 1
+            yield item
+
+    async def __aiter__(self):
+        index = 0
+        while True:
+            item = await asyncio.to_thread(self._get, index)
+            if item is _END:
+                return
+            index += 1
+            yield item
+
+class Pipeline:
+    """
+    Runs agents as a dependency graph instead of a fixed sequence.
+
+    Each agent declares the context keys it reads (`inputs`) and writes
+    (`outputs`). A stage starts as soon as every stage producing one of its
+    inputs has finished, so independent stages (e.g. images and voice-over)
+    run at the same time.
+
+    A producer can also publish an output element by element (`streams`);
+    a consumer that lists the key in `stream_inputs` starts as soon as the
+    producer has started and reads context['streams'][key] as it fills.
+    """
+    def __init__(self, agents, max_workers=4):
+        self.agents = agents
+        self.max_workers = max(1, int(max_workers))
+        self.upstream, self.started_upstream = self._build_graph()
+
+    def _build_graph(self):
+        producers = {}
+        for agent in self.agents:
+            for key in agent.outputs:
+                if key in producers:
+                    raise ValueError(
+                        f"Context key '{key}' is produced by both "
+                        f"{producers[key].name} and {agent.name}"
+                    )
+                producers[key] = agent
+
+        upstream = {}
+        started_upstream = {}
+        for agent in self.agents:
+            deps = set()
+            soft = set()
+            for key in agent.inputs:
+                producer = producers.get(key)
+                if producer is None or producer is agent:
+                    continue
+                if key in agent.stream_inputs and key in producer.streams:
+                    soft.add(producer)
+                else:
+                    deps.add(producer)
+            upstream[agent] = deps
+            started_upstream[agent] = soft - deps
+
+        # Reject cycles up front rather than deadlocking at run time
+        resolved = set()
+        remaining = list(self.agents)
+        while remaining:
+            ready = [a for a in remaining if (upstream[a] | started_upstream[a]) <= resolved]
+            if not ready:
+                names = ", ".join(a.name for a in remaining)
+                raise ValueError(f"Pipeline has a dependency cycle between: {names}")
+            resolved.update(ready)
+            remaining = [a for a in remaining if a not in resolved]
+
+        return upstream, started_upstream
+
+    def run(self, context):
+        # Inputs that no stage produces must already be in the context
+        produced = {key for agent in self.agents for key in agent.outputs}
+        for agent in self.agents:
+            missing = [k for k in agent.inputs if k not in produced and k not in context]
+            if missing:
+                raise ValueError(f"{agent.name} needs {missing} but nothing provides it")
+
+        lock = threading.Lock()
+        done = set()
+        started = set()
+        pending = list(self.agents)
+        running = {}
+        failure = None
+
+        streams = {key: ElementStream() for agent in self.agents for key in agent.streams}
+        context['streams'] = streams
+
+        def run_stage(agent):
+            try:
+                with span(agent.name, kind="stage"):
+                    result = agent.run(context)
+            finally:
+                # Consumers must never wait on a producer that has stopped
+                for key in agent.streams:
+                    streams[key].close()
+            # Agents return the context they were given; merge defensively
+            # in case one hands back a fresh dict.
+            if result is not None and result is not context:
+                with lock:
+                    for key in agent.outputs:
+                        if key in result:
+                            context[key] = result[key]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                if failure is None:
+                    ready = [a for a in pending if self.upstream[a] <= done and self.started_upstream[a] <= started]
+                    for agent in ready:
+                        pending.remove(agent)
+                        started.add(agent)
+                        running[run_in_context(executor, run_stage, agent)] = agent
+
+                if not running:
+                    break
+
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    agent = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        if failure is None:
+                            failure = StageError(agent.name, error)
+                    else:
+                        done.add(agent)
+
+        context.pop('streams', None)
+        if failure is not None:
+            raise failure
+        return context
@@ -1,55 +1,135 @@
 import os
 from agents.base import BaseAgent
-from utils.google_api import generate_image
+from utils.google_api import agenerate_image
+from utils import async_runner
+
+# Lower rank is generated first
+PRIORITY_RANK = {"must_have": 0, "nice_to_have": 1}
 
 class ProductionAgent(BaseAgent):
+    # 'structure' is read for the slot priorities
+    inputs = ('image_prompts', 'structure')
+    outputs = ('images',)
+    # Prompts are picked up one by one while ImagePromptAgent is still writing them
+    stream_inputs = ('image_prompts',)
+
     def run(self, context):
         print("--- Starting Production Agent ---")
+
+        # Create asset directories
+        img_dir = os.path.join(context['paths']['root'], 'assets', 'images')
+        os.makedirs(img_dir, exist_ok=True)
+
+        priorities = self.slot_priorities(context.get('structure'))
+        concurrency = self.config['runtime'].get('image_concurrency', 8)
+
+        images = {}
+        stream = context.get('streams', {}).get('image_prompts')
+        if stream is not None:
+            print(f"Generating images as prompts arrive, up to {concurrency} at a time")
+            async_runner.run(self.generate_streamed(stream, img_dir, priorities, images, concurrency))
+
         image_prompts_data = context.get('image_prompts')
-        
+
         if not image_prompts_data:
              print("WARNING: No image prompts found for Production Agent")
+             context['images'] = images
              return context
 
         image_prompts = image_prompts_data.get('image_prompts', [])
-        
-        # Create asset directories
-        img_dir = os.path.join(context['paths']['root'], 'assets', 'images')
-        os.makedirs(img_dir, exist_ok=True)
-        
+
+        # Everything the stream did not deliver (all of it when run on its own)
+        jobs = []
         for i, segment in enumerate(image_prompts):
-            seg_id = segment.get('slot_id', str(i))
-            
-            if 'prompt_text' in segment:
-                img_path = os.path.join(img_dir, f"{seg_id}.png")
-                
-                # Check for likely extensions to avoid re-generating and VALIDATE SIZE
-                base_path = os.path.splitext(img_path)[0]
-                existing_file = None
-                for ext in ['.png', '.jpg', '.jpeg']:
-                    candidate = base_path + ext
-                    if os.path.exists(candidate):
-                        if os.path.getsize(candidate) > 1024:
-                            existing_file = candidate
-                            break
-                        else:
-                            print(f"WARNING: Found corrupt/small image file {candidate}. Deleting to regenerate.")
-                            try:
-                                os.remove(candidate)
-                            except Exception as e:
-                                print(f"Failed to delete {candidate}: {e}")
-                
-                if existing_file:
-                    final_path = existing_file
-                else:
-                    # If not exists, generate. generate_image returns the actual path used.
-                    final_path = generate_image(
-                        prompt_text=segment['prompt_text'], 
-                        output_path=img_path,
-                        model_key="image_main"
-                    )
-                
-                segment['image_path'] = final_path
-                
-        context['image_prompts'] = image_prompts_data
+            if segment.get('slot_id', str(i)) in images:
+                continue
+            job = self.plan_job(i, segment, img_dir, priorities, images)
+            if job:
+                jobs.append(job)
+
+        if jobs:
+            print(f"Generating {len(jobs)} images ({len(images)} reused), up to {concurrency} at a time")
+            async_runner.run(self.generate_all(jobs, images, concurrency))
+
+        context['images'] = images
         return context
+
+    def plan_job(self, index, segment, img_dir, priorities, images):
+        """Reuses an existing image for the segment, or returns a (rank, job) queue entry for it."""
+        seg_id = segment.get('slot_id', str(index))
+
+        if 'prompt_text' not in segment:
+            return None
+
+        img_path = os.path.join(img_dir, f"{seg_id}.png")
+        existing_file = self.find_existing(img_path)
+
+        if existing_file:
+            images[seg_id] = existing_file
+            return None
+
+        priority = segment.get('priority') or priorities.get(seg_id)
+        rank = PRIORITY_RANK.get(priority, len(PRIORITY_RANK))
+        return rank, (seg_id, segment, img_path)
+
+    def slot_priorities(self, structure):
+        priorities = {}
+        for seg in (structure or {}).get('segments', []):
+            for slot in seg.get('visual_slots', []):
+                if slot.get('slot_id'):
+                    priorities[slot['slot_id']] = slot.get('priority')
+        return priorities
+
+    def find_existing(self, img_path):
+        # Check for likely extensions to avoid re-generating and VALIDATE SIZE
+        base_path = os.path.splitext(img_path)[0]
+        for ext in ['.png', '.jpg', '.jpeg']:
+            candidate = base_path + ext
+            if os.path.exists(candidate):
+                if os.path.getsize(candidate) > 1024:
+                    return candidate
+                else:
+                    print(f"WARNING: Found corrupt/small image file {candidate}. Deleting to regenerate.")
+                    try:
+                        os.remove(candidate)
+                    except Exception as e:
+                        print(f"Failed to delete {candidate}: {e}")
+        return None
+
+    async def generate_all(self, jobs, images, concurrency):
+        """
+        Fans the image requests out over a fixed number of workers. Workers
+        pull from a priority queue, so must_have slots go first; each image
+        is on disk and recorded the moment its response arrives.
+        """
+        await async_runner.worker_pool(lambda job: self.generate(job, images), concurrency, jobs=jobs)
+
+    async def generate_streamed(self, stream, img_dir, priorities, images, concurrency):
+        """
+        Same worker pool, fed from the prompt stream. Slots queue up as their
+        prompts close, so the first images are in flight while the model is
+        still writing the rest; must_have slots still jump the queue.
+        """
+        async def arriving():
+            index = 0
+            async for segment in stream:
+                job = self.plan_job(index, segment, img_dir, priorities, images)
+                if job:
+                    yield job
+                index += 1
+
+        await async_runner.worker_pool(lambda job: self.generate(job, images), concurrency, source=arriving())
+
+    async def generate(self, job, images):
+        seg_id, segment, img_path = job
+        try:
+            # agenerate_image returns the actual path used
+            final_path = await agenerate_image(
+                prompt_text=segment['prompt_text'],
+                output_path=img_path,
+                model_key="image_main"
+            )
+        except Exception as e:
+            print(f"ERROR: Image generation failed for {seg_id}: {e}")
+            final_path = ""
+        images[seg_id] = final_path
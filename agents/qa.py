@@ -1,9 +1,19 @@
 import os
-import json
 from agents.base import BaseAgent
 from utils.google_api import generate_text
 
 class QAAgent(BaseAgent):
+    inputs = ('brief', 'script', 'structure')
+    outputs = ('qa_report',)
+    artifacts = {'qa_report': 'qa_report.md'}
+    input_fields = ('brief', 'script', 'structure.target_duration_minutes', 'structure.total_estimated_minutes',
+                    'structure.segments.id', 'structure.segments.type', 'structure.segments.start_time_sec',
+                    'structure.segments.end_time_sec', 'structure.segments.narration_ref',
+                    'structure.segments.visual_slots.slot_id', 'structure.segments.visual_slots.visual_concept',
+                    'structure.ad_break_suggestions')
+    trim_fields = ('script',)
+    shared_input = 'script'
+
     def run(self, context):
         print("--- Starting QA Agent ---")
         brief = context.get('brief')
@@ -11,6 +21,10 @@ class QAAgent(BaseAgent):
         structure = context.get('structure')
         
         system_prompt = self.load_prompt('qa_agent.md')
+
+        fingerprint = self.fingerprint(context, system_prompt)
+        if self.recall(context, fingerprint):
+            return context
         
         input_data = {
             "brief": brief,
@@ -18,17 +32,22 @@ class QAAgent(BaseAgent):
             "structure": structure
         }
         
-        input_str = json.dumps(input_data, indent=2, default=str)
+        input_str, script_text = self.serialize_input(input_data)
         
         response = generate_text(
             system_prompt=system_prompt,
-            user_prompt=f"Review this episode data and produce a QA report:\n{input_str}",
-            model_key="text_main"
+            user_prompt=f"The script is above. Review it with this episode data and produce a QA report:\n{input_str}",
+            model_key=self.model_key,
+            temperature=self.temperature,
+            shared_context=script_text
         )
         
         context['qa_report'] = response
         
         with open(os.path.join(context['paths']['root'], 'qa_report.md'), 'w') as f:
             f.write(response)
+
+        if response:
+            self.remember(context, fingerprint)
             
         return context
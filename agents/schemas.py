@@ -0,0 +1,179 @@
+# Response schemas for the JSON-producing agents. They are sent to the model
+# as its response schema (JSON mode) and checked again locally by
+# utils.structured before a response is accepted. Only the fields the
+# pipeline actually relies on are required. TIMELINE is the exception: the
+# timeline is built locally, and the schema only checks that build.
+
+def _number():
+    return {"type": "number"}
+
+# Segmentation only: segment, slot and ad break times are computed locally
+# (utils.timing), so the model isn't asked for them.
+STRUCTURE = {
+    "type": "object",
+    "properties": {
+        "episode_id": {"type": "string"},
+        "target_duration_minutes": _number(),
+        "segments": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "type": {"type": "string", "enum": ["hook", "intro", "body", "reveal", "transition", "conclusion"]},
+                    "narration_ref": {
+                        "type": "object",
+                        "properties": {
+                            "from_paragraph_index": {"type": "integer"},
+                            "to_paragraph_index": {"type": "integer"},
+                        },
+                    },
+                    "visual_slots": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "slot_id": {"type": "string"},
+                                "visual_concept": {"type": "string"},
+                                "source_segment_title": {"type": "string"},
+                                "priority": {"type": "string", "enum": ["must_have", "nice_to_have"]},
+                            },
+                            "required": ["slot_id"],
+                        },
+                    },
+                },
+                "required": ["id", "narration_ref", "visual_slots"],
+            },
+        },
+        "ad_break_suggestions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"after_segment_id": {"type": "string"}, "reason": {"type": "string"}},
+            },
+        },
+        "notes_for_next_agents": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["segments"],
+}
+
+IMAGE_PROMPTS = {
+    "type": "object",
+    "properties": {
+        "episode_id": {"type": "string"},
+        "image_prompts": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "slot_id": {"type": "string"},
+                    "segment_id": {"type": "string"},
+                    "start_time_sec": _number(),
+                    "end_time_sec": _number(),
+                    "prompt_text": {"type": "string"},
+                    "safety_notes": {"type": "string"},
+                },
+                "required": ["slot_id", "prompt_text"],
+            },
+        },
+    },
+    "required": ["image_prompts"],
+}
+
+TTS_PLAN = {
+    "type": "object",
+    "properties": {
+        "episode_id": {"type": "string"},
+        "voice_profile": {
+            "type": "object",
+            "properties": {
+                "engine": {"type": "string"},
+                "default_voice": {"type": "string"},
+                "language_code": {"type": "string"},
+            },
+        },
+        "audio_chunks": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "chunk_id": {"type": "string"},
+                    "segment_id": {"type": "string"},
+                    "start_time_sec": _number(),
+                    "end_time_sec": _number(),
+                    "paragraph_range": {
+                        "type": "object",
+                        "properties": {
+                            "from_paragraph_index": {"type": "integer"},
+                            "to_paragraph_index": {"type": "integer"},
+                        },
+                    },
+                    "text": {"type": "string"},
+                    "tts_params": {
+                        "type": "object",
+                        "properties": {
+                            "voice_name": {"type": "string"},
+                            "speaking_rate": _number(),
+                            "pitch": _number(),
+                        },
+                    },
+                    "output_file": {"type": "string"},
+                },
+                "required": ["chunk_id", "segment_id", "text", "output_file"],
+            },
+        },
+        "notes_for_renderer": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["audio_chunks"],
+}
+
+# Not a response schema: what agents.assembly.build_timeline must produce
+# for tools/render_video.py, checked before timeline.json is written.
+TIMELINE = {
+    "type": "object",
+    "properties": {
+        "episode_id": {"type": "string"},
+        "frame_rate": _number(),
+        "resolution": {
+            "type": "object",
+            "properties": {"width": {"type": "integer"}, "height": {"type": "integer"}},
+        },
+        "tracks": {
+            "type": "object",
+            "properties": {
+                "video": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "slot_id": {"type": "string"},
+                            "segment_id": {"type": "string"},
+                            "image_file": {"type": "string"},
+                            "start_time_sec": _number(),
+                            "end_time_sec": _number(),
+                            "transition_in": {"type": "string", "enum": ["fade", "cut"]},
+                            "transition_out": {"type": "string", "enum": ["fade", "cut"]},
+                        },
+                        "required": ["image_file", "start_time_sec", "end_time_sec"],
+                    },
+                },
+                "audio": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "chunk_id": {"type": "string"},
+                            "audio_file": {"type": "string"},
+                            "start_time_sec": _number(),
+                            "end_time_sec": _number(),
+                            "duck_under_other_audio": {"type": "boolean"},
+                        },
+                        "required": ["audio_file", "start_time_sec", "end_time_sec"],
+                    },
+                },
+            },
+            "required": ["video", "audio"],
+        },
+    },
+    "required": ["tracks"],
+}
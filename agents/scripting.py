@@ -1,10 +1,20 @@
+import copy
 import json
 import yaml
 import os
+import hashlib
 from agents.base import BaseAgent
-from utils.google_api import generate_text, generate_image
+from agents import schemas
+from utils.google_api import generate_text, generate_text_stream
+from utils.structured import complete_json
+from utils.json_stream import JsonArrayStream
+from utils import timing
 
 class ScriptAgent(BaseAgent):
+    inputs = ('brief',)
+    outputs = ('script',)
+    artifacts = {'script': 'script.md'}
+
     def run(self, context):
         print("--- Starting Script Agent ---")
         brief = context['brief']
@@ -14,60 +24,119 @@ class ScriptAgent(BaseAgent):
             print("WARNING: No 'series' found in brief. Defaulting to 'Power, Empires & Diplomacy'")
             brief['series'] = "Power, Empires & Diplomacy"
 
+        fingerprint = self.fingerprint(context, system_prompt)
+        if self.recall(context, fingerprint):
+            return context
+
         brief_str = yaml.dump(brief)
         
         script_content = generate_text(
             system_prompt=system_prompt,
             user_prompt=f"Here is the episode brief:\n{brief_str}",
-            model_key="text_main"
+            model_key=self.model_key,
+            temperature=self.temperature
         )
         
         context['script'] = script_content
         
         with open(os.path.join(context['paths']['root'], 'script.md'), 'w') as f:
             f.write(script_content)
+
+        if script_content:
+            self.remember(context, fingerprint)
             
         return context
 
 class StructureTimingAgent(BaseAgent):
+    inputs = ('brief', 'script')
+    outputs = ('structure',)
+    artifacts = {'structure': 'structure.json'}
+    # No trim_fields: segments map to script paragraphs by index, and
+    # timing.estimate_times counts them in the full script, so the model
+    # must see every paragraph even past the token budget
+    shared_input = 'script_content'
+    response_schema = schemas.STRUCTURE
+
+    def fingerprint(self, context, system_prompt):
+        # Timing settings shape structure.json too. Calibrated voice rates
+        # don't: a rerun keeps the times the episode was first given.
+        settings = {key: value for key, value in (self.config.get('timing', {}) or {}).items() if key != 'calibration'}
+        base = super().fingerprint(context, system_prompt)
+        return hashlib.sha256((base + json.dumps(settings, sort_keys=True)).encode('utf-8')).hexdigest()
+
     def run(self, context):
         print("--- Starting Structure & Timing Agent ---")
         script = context['script']
         brief = context['brief']
         system_prompt = self.load_prompt('structure_timing_agent.md')
+
+        fingerprint = self.fingerprint(context, system_prompt)
+        if self.recall(context, fingerprint):
+            return context
         
         input_data = {
             "brief": brief,
             "script_content": script
         }
-        input_str = json.dumps(input_data, indent=2, default=str)
+        input_str, script_text = self.serialize_input(input_data)
 
+        user_prompt = f"The script is above. Here is the episode brief. Produce the STRUCTURE OBJECT JSON:\n{input_str}"
         response = generate_text(
             system_prompt=system_prompt,
-            user_prompt=f"Here is the episode data. Produce the STRUCTURE OBJECT JSON:\n{input_str}",
-            model_key="text_main"
+            user_prompt=user_prompt,
+            model_key=self.model_key,
+            temperature=self.temperature,
+            response_schema=self.response_schema,
+            shared_context=script_text
         )
-        
-        if "```json" in response:
-            response = response.split("```json")[1].split("```")[0].strip()
-        elif "```" in response:
-            response = response.split("```")[1].split("```")[0].strip()
-            
-        try:
-            structure = json.loads(response)
-            context['structure'] = structure
-            
-            with open(os.path.join(context['paths']['root'], 'structure.json'), 'w') as f:
-                json.dump(structure, f, indent=2)
-                
-        except json.JSONDecodeError:
+        structure = complete_json(
+            response, system_prompt, user_prompt, self.response_schema, self.model_key, self.temperature,
+            list_key='segments', id_field='id', label="Structure Agent output", shared_context=script_text
+        )
+
+        if structure is None:
             print("ERROR: Failed to parse JSON from Structure Agent")
             with open(os.path.join(context['paths']['root'], 'structure_error.txt'), 'w') as f:
-                f.write(response)
-            
+                f.write(response or "")
+            return context
+
+        self.add_times(structure, script)
+        context['structure'] = structure
+
+        with open(os.path.join(context['paths']['root'], 'structure.json'), 'w') as f:
+            json.dump(structure, f, indent=2)
+
+        self.remember(context, fingerprint)
         return context
 
+    def add_times(self, structure, script):
+        """Segment, slot and ad break times from the narration's word counts at the voice's speaking rate."""
+        settings = self.config.get('timing', {}) or {}
+        rate, source = timing.words_per_sec(self.config, timing.voice_rates(self.config))
+        timing.estimate_times(structure, script, rate, float(settings.get('paragraph_pause_sec', 0.4)))
+
+        total = structure['total_estimated_minutes']
+        print(f"Timed {len(structure.get('segments', []))} segments at {rate * 60:.0f} wpm ({source}): {total:.1f} min")
+        target = structure.get('target_duration_minutes')
+        try:
+            target = float(target)
+        except (TypeError, ValueError):
+            return
+        if target and abs(total - target) > 0.15 * target:
+            print(f"WARNING: Narration runs {total:.1f} min against a {target:g} min target")
+
 class ImagePromptAgent(BaseAgent):
+    inputs = ('structure',)
+    outputs = ('image_prompts',)
+    # Each prompt is published as soon as it closes in the model's streamed
+    # output, so ProductionAgent can start generating images right away.
+    streams = ('image_prompts',)
+    artifacts = {'image_prompts': 'image_prompts.json'}
+    response_schema = schemas.IMAGE_PROMPTS
+    input_fields = ('episode_id', 'segments.id', 'segments.type', 'segments.start_time_sec',
+                    'segments.end_time_sec', 'segments.visual_slots', 'notes_for_next_agents')
+    sharded = True
+
     def run(self, context):
         print("--- Starting Image Prompt Agent ---")
         structure = context.get('structure')
@@ -76,27 +145,110 @@ class ImagePromptAgent(BaseAgent):
              return context
 
         system_prompt = self.load_prompt('image_prompt_agent.md')
+        stream = context.get('streams', {}).get('image_prompts')
+
+        fingerprint = self.fingerprint(context, system_prompt)
+        if self.recall(context, fingerprint):
+            self.publish(stream, context['image_prompts'].get('image_prompts', []), [])
+            return context
         
-        input_str = json.dumps(structure, indent=2)
-        
-        response = generate_text(
-            system_prompt=system_prompt,
-            user_prompt=f"Generate image prompts for this structure:\n{input_str}",
-            model_key="text_main"
+        segments = structure.get('segments', [])
+        shards = self.shard_segments(segments)
+        header = {key: value for key, value in structure.items() if key != 'segments'}
+        results = self.map_shards(
+            lambda shard: self.prompt_shard(system_prompt, dict(header, segments=shard), len(shards) > 1, stream),
+            shards
         )
-        
-        if "```json" in response:
-            response = response.split("```json")[1].split("```")[0].strip()
-        elif "```" in response:
-            response = response.split("```")[1].split("```")[0].strip()
-            
-        try:
-            image_prompts = json.loads(response)
-            context['image_prompts'] = image_prompts
-            
-            with open(os.path.join(context['paths']['root'], 'image_prompts.json'), 'w') as f:
-                json.dump(image_prompts, f, indent=2)
-        except:
+        if any(prompts is None for prompts, _ in results):
             print("ERROR: Failed to parse JSON from Image Prompt Agent")
-            
+            return context
+
+        # Shards come back in segment order, so concatenating keeps it
+        streamed = [element for _, shard_streamed in results for element in shard_streamed]
+        image_prompts = {
+            "episode_id": structure.get('episode_id'),
+            "image_prompts": [prompt for prompts, _ in results for prompt in prompts],
+        }
+
+        # The artifact is copied before publishing: the published dicts
+        # belong to the consumer threads from then on
+        saved = copy.deepcopy(image_prompts)
+
+        self.publish(stream, image_prompts.get('image_prompts', []), streamed)
+        context['image_prompts'] = image_prompts
+
+        with open(os.path.join(context['paths']['root'], 'image_prompts.json'), 'w') as f:
+            json.dump(saved, f, indent=2)
+
+        self.remember(context, fingerprint)
         return context
+
+    def prompt_shard(self, system_prompt, structure, partial, stream):
+        """
+        Image prompts for the segments in structure, published to stream as
+        they close. Returns (prompts or None, streamed elements).
+        """
+        input_str, _ = self.serialize_input(structure)
+        if partial:
+            user_prompt = f"Generate image prompts for the visual slots of these segments of the episode's structure:\n{input_str}"
+        else:
+            user_prompt = f"Generate image prompts for this structure:\n{input_str}"
+
+        parser = JsonArrayStream('image_prompts')
+        streamed = []
+        pieces = []
+        for piece in generate_text_stream(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            model_key=self.model_key,
+            temperature=self.temperature,
+            response_schema=self.response_schema
+        ):
+            pieces.append(piece)
+            for element in parser.feed(piece):
+                streamed.append(element)
+                if stream is not None:
+                    stream.publish(element)
+
+        # Repairs a cut-off answer and asks again for any slots it lacks
+        slot_ids = [slot.get('slot_id') for seg in structure.get('segments', []) for slot in seg.get('visual_slots', [])]
+        expected = [i for i in slot_ids if i]
+        result = complete_json(
+            "".join(pieces), system_prompt, user_prompt, self.response_schema,
+            model_key=self.model_key,
+            temperature=self.temperature,
+            list_key='image_prompts',
+            id_field='slot_id',
+            expected_ids=expected,
+            label="Image Prompt Agent output"
+        )
+        if result is None:
+            if not streamed:
+                return None, streamed
+            print(f"WARNING: Image Prompt Agent output broke off; keeping the {len(streamed)} prompts that completed")
+            # Shallow copies: consumers are already adding fields to the streamed dicts
+            result = {"image_prompts": [dict(element) for element in streamed]}
+
+        prompts = result.get('image_prompts', [])
+        if partial:
+            # Other shards own the rest of the episode's slots
+            order = {slot_id: i for i, slot_id in enumerate(expected)}
+            prompts = sorted((p for p in prompts if p.get('slot_id') in order), key=lambda p: order[p['slot_id']])
+        return prompts, streamed
+
+    def publish(self, stream, prompts, streamed):
+        """
+        Swaps the already-streamed objects into the final list, so consumers
+        and context['image_prompts'] share the same dicts, then publishes
+        whatever the incremental parser did not catch.
+        """
+        # Matched by slot id: repaired or re-asked entries can land anywhere in the list
+        by_slot = {element.get('slot_id'): element for element in streamed}
+        for i, element in enumerate(prompts):
+            known = by_slot.get(element.get('slot_id'))
+            # A streamed prompt without text was skipped by consumers; its
+            # re-asked replacement goes out as a new element
+            if known is not None and known.get('prompt_text'):
+                prompts[i] = known
+            elif stream is not None:
+                stream.publish(element)
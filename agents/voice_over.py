@@ -1,92 +1,250 @@
 import os
 import json
 from agents.base import BaseAgent
-from utils.google_api import generate_text, synthesize_speech
+from agents import schemas
+from utils.google_api import asynthesize_speech
+from utils.structured import generate_json
+from utils.audio import duration_sec
+from utils import timing, async_runner
 
 class VoiceOverAgent(BaseAgent):
+    inputs = ('brief', 'script', 'structure')
+    outputs = ('tts_plan',)
+    artifacts = {'tts_plan': 'tts_plan.json'}
+    response_schema = schemas.TTS_PLAN
+    # The full script is needed verbatim, so nothing here is trimmed
+    input_fields = ('metadata', 'script_full_text', 'structure.segments.id', 'structure.segments.type',
+                    'structure.segments.start_time_sec', 'structure.segments.end_time_sec',
+                    'structure.segments.narration_ref')
+    shared_input = 'script_full_text'
+    sharded = True
+
     def run(self, context):
         print("--- Starting Voice-Over Agent ---")
         script = context.get('script')
         structure = context.get('structure')
-        brief = context.get('brief')
-        
+
         if not script or not structure:
             print("ERROR: Missing script or structure for VO Agent")
             return context
 
         system_prompt = self.load_prompt('voice_over_agent.md')
-        
+
+        fingerprint = self.fingerprint(context, system_prompt)
+        if not self.recall(context, fingerprint):
+            if not self.plan(context, system_prompt):
+                return context
+            self.remember(context, fingerprint)
+
+        # --- EXECUTION PHASE ---
+        synthesized = self.synthesize(context, context['tts_plan'])
+        if self.measure(context['tts_plan'], synthesized):
+            # tts_plan.json carries the measured times too; re-recorded so it still counts as this stage's output
+            self.save_plan(context, context['tts_plan'])
+            self.remember(context, fingerprint)
+        return context
+
+    def plan(self, context, system_prompt):
+        """Asks the model for the TTS plan. Returns False if it could not be parsed."""
+        structure = context.get('structure')
+
+        shards = self.shard_segments(structure.get('segments', []))
+        header = {key: value for key, value in structure.items() if key != 'segments'}
+        plans = self.map_shards(
+            lambda shard: self.plan_shard(context, system_prompt, dict(header, segments=shard), len(shards) > 1),
+            shards
+        )
+        if any(plan is None for plan in plans):
+            print("ERROR: Failed to parse JSON from VO Agent")
+            return False
+
+        tts_plan = merge_plans(plans)
+        context['tts_plan'] = tts_plan
+        self.save_plan(context, tts_plan)
+        return True
+
+    def plan_shard(self, context, system_prompt, structure, partial):
+        """TTS plan for the segments in structure, or None."""
+        brief = context.get('brief')
         input_data = {
             "metadata": {
                 "title": brief.get('title'),
                 "series": brief.get('series')
             },
-            "script_full_text": script,
+            "script_full_text": context.get('script'),
             "structure": structure
         }
-        
-        input_str = json.dumps(input_data, indent=2, default=str)
-        
-        response = generate_text(
+
+        # The script goes out whole with every shard; as shared context it is
+        # uploaded once when context caching is on
+        input_str, script_text = self.serialize_input(input_data)
+
+        segment_ids = [seg.get('id') for seg in structure.get('segments', []) if seg.get('id')]
+        if partial:
+            user_prompt = (f"The full script is above. Create the TTS plan for only these segments "
+                           f"({', '.join(segment_ids)}), covering just their paragraphs:\n{input_str}")
+        else:
+            user_prompt = f"The full script is above. Create a TTS plan based on it and this structure:\n{input_str}"
+
+        tts_plan = generate_json(
             system_prompt=system_prompt,
-            user_prompt=f"Create a TTS plan based on this script and structure:\n{input_str}",
-            model_key="text_main"
+            user_prompt=user_prompt,
+            schema=self.response_schema,
+            model_key=self.model_key,
+            temperature=self.temperature,
+            shared_context=script_text,
+            list_key='audio_chunks',
+            id_field='segment_id',
+            expected_ids=segment_ids,
+            label="VO Agent output"
         )
-        
-        if "```json" in response:
-            response = response.split("```json")[1].split("```")[0].strip()
-        elif "```" in response:
-            response = response.split("```")[1].split("```")[0].strip()
-            
-        try:
-            tts_plan = json.loads(response)
-            context['tts_plan'] = tts_plan
-            
-            with open(os.path.join(context['paths']['root'], 'tts_plan.json'), 'w') as f:
-                json.dump(tts_plan, f, indent=2)
-                
-            # --- EXECUTION PHASE ---
-            audio_dir = os.path.join(context['paths']['root'], 'assets', 'audio')
-            os.makedirs(audio_dir, exist_ok=True)
-            
-            voice_params = self.config.get('tts', {})
-            
-            for chunk in tts_plan.get('audio_chunks', []):
-                text = chunk.get('text')
-                filename = chunk.get('output_file')
-                if text and filename:
-                    filename = os.path.basename(filename)
-                    out_path = os.path.join(audio_dir, filename)
-                    
-                    # Check for existing file with likely extensions and VALIDATE SIZE
-                    base_path = os.path.splitext(out_path)[0]
-                    existing_file = None
-                    for ext in ['.wav', '.mp3']:
-                        candidate = base_path + ext
-                        if os.path.exists(candidate):
-                            # Check if file is valid (e.g. > 1KB)
-                            if os.path.getsize(candidate) > 1024:
-                                existing_file = candidate
-                                break
-                            else:
-                                print(f"WARNING: Found corrupt/small audio file {candidate}. Deleting to regenerate.")
-                                try:
-                                    os.remove(candidate)
-                                except Exception as e:
-                                    print(f"Failed to delete {candidate}: {e}")
-
-                    if existing_file:
-                        final_path = existing_file
-                    else:
-                        final_path = synthesize_speech(
-                            text=text, 
-                            voice_params=voice_params, 
-                            output_path=out_path
-                        )
-                    
-                    chunk['absolute_path'] = final_path
-
-        except json.JSONDecodeError:
-            print("ERROR: Failed to parse JSON from VO Agent")
-            
-        return context
+        if tts_plan is not None and partial:
+            wanted = set(segment_ids)
+            tts_plan['audio_chunks'] = [c for c in tts_plan.get('audio_chunks', []) if c.get('segment_id') in wanted]
+        return tts_plan
+
+    def synthesize(self, context, tts_plan):
+        audio_dir = os.path.join(context['paths']['root'], 'assets', 'audio')
+        os.makedirs(audio_dir, exist_ok=True)
+
+        voice_params = self.config.get('tts', {})
+
+        jobs = []
+        for chunk in tts_plan.get('audio_chunks', []):
+            text = chunk.get('text')
+            filename = chunk.get('output_file')
+            if text and filename:
+                filename = os.path.basename(filename)
+                out_path = os.path.join(audio_dir, filename)
+
+                existing_file = self.find_existing(out_path)
+                if existing_file:
+                    chunk['absolute_path'] = existing_file
+                else:
+                    jobs.append((chunk, out_path))
+
+        if jobs:
+            concurrency = self.config['runtime'].get('tts_concurrency', 4)
+            print(f"Synthesizing {len(jobs)} audio chunks, up to {concurrency} at a time (longest first)")
+            async_runner.run(self.synthesize_all(jobs, voice_params, concurrency))
+        return [chunk for chunk, _ in jobs]
+
+    def save_plan(self, context, tts_plan):
+        # Local file paths are found again on every run, so they stay out of the artifact
+        saved = dict(tts_plan, audio_chunks=[{k: v for k, v in chunk.items() if k != 'absolute_path'}
+                                             for chunk in tts_plan.get('audio_chunks', [])])
+        with open(os.path.join(context['paths']['root'], 'tts_plan.json'), 'w') as f:
+            json.dump(saved, f, indent=2)
+
+    def measure(self, tts_plan, synthesized):
+        """
+        Replaces the planned chunk times with the measured length of their
+        audio, laid back to back, and records the narration synthesized in
+        this run towards the voice's calibrated speaking rate. Returns True
+        if any chunk was measured.
+        """
+        cursor = 0.0
+        measured = False
+        for chunk in tts_plan.get('audio_chunks', []):
+            path = chunk.get('absolute_path')
+            seconds = duration_sec(path) if path else None
+            if not seconds:
+                continue
+            chunk['duration_sec'] = round(seconds, 3)
+            chunk['start_time_sec'] = round(cursor, 3)
+            chunk['end_time_sec'] = round(cursor + seconds, 3)
+            cursor += seconds
+            measured = True
+
+        words = sum(timing.word_count(c['text']) for c in synthesized if c.get('duration_sec'))
+        seconds = sum(c['duration_sec'] for c in synthesized if c.get('duration_sec'))
+        if not words:
+            return measured
+        print(f"Narration measured at {words / seconds * 60:.0f} wpm over {seconds:.0f}s of new audio")
+        rates = timing.voice_rates(self.config)
+        if rates is not None:
+            try:
+                rates.record(timing.voice_key(self.config), words, seconds)
+            except Exception as e:
+                print(f"WARNING: Could not record the voice's speaking rate: {e}")
+        return measured
+
+    def find_existing(self, out_path):
+        # Check for existing file with likely extensions and VALIDATE SIZE
+        base_path = os.path.splitext(out_path)[0]
+        for ext in ['.wav', '.mp3']:
+            candidate = base_path + ext
+            if os.path.exists(candidate):
+                # Check if file is valid (e.g. > 1KB)
+                if os.path.getsize(candidate) > 1024:
+                    return candidate
+                else:
+                    print(f"WARNING: Found corrupt/small audio file {candidate}. Deleting to regenerate.")
+                    try:
+                        os.remove(candidate)
+                    except Exception as e:
+                        print(f"Failed to delete {candidate}: {e}")
+        return None
+
+    async def synthesize_all(self, jobs, voice_params, concurrency):
+        """
+        Runs a bounded pool of synthesis workers. Chunks are started longest
+        text first (LPT scheduling), so the slowest chunks don't end up
+        starting last and stretching the stage.
+        """
+        async def synthesize(job):
+            chunk, out_path = job
+            try:
+                final_path = await asynthesize_speech(
+                    text=chunk['text'],
+                    voice_params=voice_params,
+                    output_path=out_path
+                )
+            except Exception as e:
+                print(f"ERROR: Synthesis failed for {os.path.basename(out_path)}: {e}")
+                final_path = ""
+            chunk['absolute_path'] = final_path
+
+        await async_runner.worker_pool(synthesize, concurrency, jobs=[(-len(job[0]['text']), job) for job in jobs])
+
+def _unique(name, seen, prefix):
+    """name, or prefix_name (then prefix_name_2, ...) if taken; extensions are kept."""
+    if name not in seen:
+        return name
+    stem, ext = os.path.splitext(name)
+    candidate = f"{prefix}_{stem}{ext}"
+    n = 2
+    while candidate in seen:
+        candidate = f"{prefix}_{stem}_{n}{ext}"
+        n += 1
+    return candidate
+
+def merge_plans(plans):
+    """
+    One TTS plan from per-shard plans, chunks in shard (segment) order.
+    Chunk ids and file names are made unique, since shards name their chunks
+    without seeing each other.
+    """
+    merged = {key: value for key, value in plans[0].items() if key not in ('audio_chunks', 'notes_for_renderer')}
+    chunks = []
+    notes = []
+    seen_ids = set()
+    seen_files = set()
+    for plan in plans:
+        for chunk in plan.get('audio_chunks', []):
+            if chunk.get('chunk_id') is not None:
+                chunk['chunk_id'] = _unique(str(chunk['chunk_id']), seen_ids, chunk.get('segment_id'))
+                seen_ids.add(chunk['chunk_id'])
+            # Chunks without a file are skipped by synthesize(); nothing to rename
+            if chunk.get('output_file'):
+                name = _unique(os.path.basename(chunk['output_file']), seen_files, chunk.get('segment_id'))
+                chunk['output_file'] = os.path.join(os.path.dirname(chunk['output_file']), name)
+                seen_files.add(name)
+            chunks.append(chunk)
+        for note in plan.get('notes_for_renderer', []):
+            if note not in notes:
+                notes.append(note)
+    merged['audio_chunks'] = chunks
+    if notes:
+        merged['notes_for_renderer'] = notes
+    return merged
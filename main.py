@@ -1,40 +1,37 @@
+import time
+_STARTED = time.perf_counter()
+
 import argparse
 import yaml
 import os
 import sys
-from agents.scripting import ScriptAgent, StructureTimingAgent, ImagePromptAgent
-from agents.production import ProductionAgent
-from agents.voice_over import VoiceOverAgent
-from agents.assembly import VideoAssemblyAgent
-from agents.qa import QAAgent
-from tools.render_video import render_video
+import glob
+from concurrent.futures import ThreadPoolExecutor
+from agents.pipeline import StageError
+from utils.tracing import episode_tracer, use_tracer, span
+
+# Agents (and through them the model clients) and the renderer are imported
+# where they are used, so --render-only and --help start quickly.
 
 def load_config():
     with open("config/settings.yaml", "r") as f:
         return yaml.safe_load(f)
 
-def main():
-    parser = argparse.ArgumentParser(description="KNOW: HISTORY Pipeline")
-    parser.add_argument("--brief", required=True, help="Path to the episode brief YAML")
-    parser.add_argument("--name", required=True, help="Internal name for the episode (no spaces)")
-    parser.add_argument("--render", action="store_true", help="Render final video (requires FFmpeg and real assets)")
-    args = parser.parse_args()
-
-    config = load_config()
-    
+def run_episode(name, brief_path, config, render=False):
+    """Runs the full pipeline for one episode. Raises StageError on failure."""
     # 1. Setup Episode Context
-    episode_root = os.path.join(config['project']['output_dir'], args.name)
+    episode_root = os.path.join(config['project']['output_dir'], name)
     os.makedirs(episode_root, exist_ok=True)
-    
-    print(f"Initializing Episode: {args.name}")
+
+    print(f"Initializing Episode: {name}")
     print(f"Output Directory: {episode_root}")
-    
+
     # Load Brief
-    with open(args.brief, 'r') as f:
+    with open(brief_path, 'r') as f:
         brief_data = yaml.safe_load(f)
-        
+
     context = {
-        "name": args.name,
+        "name": name,
         "brief": brief_data,
         "config": config,
         "paths": {
@@ -42,9 +39,27 @@ def main():
             "prompts": config['paths']['prompts']
         }
     }
-    
+
+    # Every stage, API call and the render append spans to <episode>/trace.jsonl;
+    # summarize with tools/trace_summary.py.
+    with use_tracer(episode_tracer(episode_root, episode=name)), span("episode", kind="episode") as episode:
+        return _run_pipeline(name, context, config, render, episode)
+
+def _run_pipeline(name, context, config, render, episode):
+    from agents.scripting import ScriptAgent, StructureTimingAgent, ImagePromptAgent
+    from agents.production import ProductionAgent
+    from agents.voice_over import VoiceOverAgent
+    from agents.assembly import VideoAssemblyAgent
+    from agents.qa import QAAgent
+    from agents.pipeline import Pipeline
+
+    # Time from interpreter start of main.py until the pipeline is ready to run
+    episode.set(startup_ms=round((time.perf_counter() - _STARTED) * 1000, 3))
+
     # 2. Run Pipeline
-    pipeline = [
+    # Stages declare their inputs/outputs; independent ones (images and
+    # voice-over, QA) run concurrently.
+    pipeline = Pipeline([
         ScriptAgent(config),
         StructureTimingAgent(config),
         ImagePromptAgent(config),
@@ -52,29 +67,141 @@ def main():
         VoiceOverAgent(config),
         VideoAssemblyAgent(config),
         QAAgent(config)
-    ]
-    
-    for agent in pipeline:
-        try:
-            context = agent.run(context)
-        except Exception as e:
-            print(f"CRITICAL ERROR in {agent.__class__.__name__}: {e}")
-            sys.exit(1)
-            
+    ], max_workers=config['runtime'].get('max_parallel_stages', 4))
+
+    context = pipeline.run(context)
+
     # 3. Render (Optional)
-    if args.render:
+    if render:
         if config['runtime']['mock_mode']:
             print("WARNING: Render requested but mock_mode is TRUE. Assets will be placeholders.")
-        
-        print("\n--- Starting Video Render ---")
+
+        print(f"\n--- Starting Video Render ({name}) ---")
+        _render(name, config)
+
+    return context
+
+def _render(name, config):
+    from tools.render_video import render_video
+    try:
+        render_video(name, config['project']['output_dir'], config.get('render'))
+    except Exception as e:
+        print(f"Render failed: {e}")
+
+def render_only(name, config):
+    """Renders an existing episode from its timeline.json without loading any agents or model clients."""
+    episode_root = os.path.join(config['project']['output_dir'], name)
+    if not os.path.isdir(episode_root):
+        print(f"ERROR: Episode directory not found: {episode_root}")
+        return False
+
+    with use_tracer(episode_tracer(episode_root, episode=name)), span("episode", kind="episode", mode="render-only") as episode:
+        episode.set(startup_ms=round((time.perf_counter() - _STARTED) * 1000, 3))
+        print(f"\n--- Starting Video Render ({name}) ---")
+        _render(name, config)
+    return True
+
+def _print_run_stats():
+    from utils.google_api import print_retry_stats, print_context_cache_stats, release_context_caches
+    from utils.compact import print_input_stats
+    print_retry_stats()
+    print_context_cache_stats()
+    print_input_stats()
+    release_context_caches()
+
+def find_briefs(batch_dir):
+    """Returns (episode_name, brief_path) for every brief YAML directly in batch_dir."""
+    paths = sorted(glob.glob(os.path.join(batch_dir, "*.yaml")) + glob.glob(os.path.join(batch_dir, "*.yml")))
+    return [(os.path.splitext(os.path.basename(p))[0], p) for p in paths]
+
+def run_batch(batch_dir, config, render=False):
+    """
+    Runs every brief in batch_dir inside this process. Episodes share the
+    API call limit in utils.google_api, so total throughput is bounded by
+    runtime.max_concurrent_api_calls rather than by the number of episodes.
+    Returns the names of episodes that failed.
+    """
+    briefs = find_briefs(batch_dir)
+    if not briefs:
+        print(f"ERROR: No brief YAML files found in {batch_dir}")
+        return []
+
+    print(f"Batch: {len(briefs)} episodes from {batch_dir}")
+    failed = []
+
+    def _run(item):
+        name, brief_path = item
         try:
-            render_video(args.name, config['project']['output_dir'])
+            run_episode(name, brief_path, config, render=render)
+            print(f"Episode complete: {name}")
         except Exception as e:
-            print(f"Render failed: {e}")
+            if isinstance(e, StageError):
+                print(f"CRITICAL ERROR in {name}/{e.agent_name}: {e.error}")
+            else:
+                print(f"CRITICAL ERROR in {name}: {e}")
+            failed.append(name)
+
+    max_episodes = config['runtime'].get('max_parallel_episodes', 4)
+    with ThreadPoolExecutor(max_workers=max(1, max_episodes)) as executor:
+        list(executor.map(_run, briefs))
+
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="KNOW: HISTORY Pipeline")
+    parser.add_argument("--brief", help="Path to the episode brief YAML")
+    parser.add_argument("--name", help="Internal name for the episode (no spaces)")
+    parser.add_argument("--batch", metavar="DIR", help="Run every brief YAML in DIR as one batch (episode names come from the file names)")
+    parser.add_argument("--render", action="store_true", help="Render final video (requires FFmpeg and real assets)")
+    parser.add_argument("--render-only", action="store_true", help="Skip the agents and only render an existing episode (--name or --batch)")
+    parser.add_argument("--fresh", action="store_true", help="Ignore recorded stage outputs and call the models again")
+    args = parser.parse_args()
+
+    if args.batch:
+        if args.brief or args.name:
+            parser.error("--batch cannot be combined with --brief/--name")
+    elif args.render_only:
+        if not args.name:
+            parser.error("--render-only needs --name (or --batch)")
+    elif not (args.brief and args.name):
+        parser.error("--brief and --name are required unless --batch is given")
+
+    config = load_config()
+    if args.fresh:
+        config['runtime']['memoize_stages'] = False
+
+    if args.render_only:
+        names = [name for name, _ in find_briefs(args.batch)] if args.batch else [args.name]
+        ok = [render_only(name, config) for name in names]
+        if not all(ok):
+            sys.exit(1)
+        return
+
+    if args.batch:
+        failed = run_batch(args.batch, config, render=args.render)
+        _print_run_stats()
+        print("\n========================================")
+        if failed:
+            print(f"Batch finished with {len(failed)} failed episode(s): {', '.join(failed)}")
+            print("========================================")
+            sys.exit(1)
+        print("Batch Complete!")
+        print(f"Check {config['project']['output_dir']} for results.")
+        print("========================================")
+        return
+
+    try:
+        run_episode(args.name, args.brief, config, render=args.render)
+    except StageError as e:
+        print(f"CRITICAL ERROR in {e.agent_name}: {e.error}")
+        _print_run_stats()
+        sys.exit(1)
+
+    _print_run_stats()
 
     print("\n========================================")
     print("Pipeline Complete!")
-    print(f"Check {episode_root} for results.")
+    print(f"Check {os.path.join(config['project']['output_dir'], args.name)} for results.")
     print("========================================")
 
 if __name__ == "__main__":
@@ -0,0 +1,47 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Each probe runs in a fresh interpreter from the project root, so the
+# numbers include every import main.py and the agents pull in.
+PROBES = {
+    "python": "pass",
+    "import main": "import main",
+    "import agents": "import agents.scripting, agents.production, agents.voice_over, agents.assembly, agents.qa",
+    "import render": "import tools.render_video",
+}
+
+def time_probe(code, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=os.getcwd())
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure pipeline startup time")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--budget-ms", type=float, help="Exit non-zero if 'import main' exceeds this median (over bare python)")
+    args = parser.parse_args()
+
+    results = {}
+    for name, code in PROBES.items():
+        samples = time_probe(code, args.runs)
+        results[name] = statistics.median(samples)
+
+    baseline = results["python"]
+    print(f"{'probe':<16}{'median ms':>12}{'over python':>14}")
+    for name, median in results.items():
+        print(f"{name:<16}{median:>12.1f}{median - baseline:>14.1f}")
+
+    overhead = results["import main"] - baseline
+    if args.budget_ms is not None and overhead > args.budget_ms:
+        print(f"FAIL: import main costs {overhead:.1f} ms, budget is {args.budget_ms:.1f} ms")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
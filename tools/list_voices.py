@@ -1,10 +1,11 @@
 import os
 import sys
-import soundfile as sf
-from kokoro_onnx import Kokoro
 import numpy as np
 
 def list_voices_and_sample():
+    import soundfile as sf
+    from kokoro_onnx import Kokoro
+
     model_path = "models/kokoro/kokoro-v0_19.int8.onnx"
     voices_path = "models/kokoro/voices.bin"
     
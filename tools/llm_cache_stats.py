@@ -0,0 +1,41 @@
+import argparse
+import os
+import sys
+import yaml
+
+sys.path.append(os.getcwd())
+
+from utils.llm_cache import ResponseCache
+
+def load_config():
+    with open("config/settings.yaml", "r") as f:
+        return yaml.safe_load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or clear the LLM response cache")
+    parser.add_argument("--clear", action="store_true", help="Drop every cached response and reset the counters")
+    args = parser.parse_args()
+
+    settings = load_config().get('llm_cache', {}) or {}
+    db_path = settings.get('db_path', os.path.join('.cache', 'llm_responses.sqlite'))
+    if not os.path.exists(db_path):
+        print(f"No response cache at {db_path}")
+        return
+
+    cache = ResponseCache(db_path, max_mb=settings.get('max_mb', 256))
+    if args.clear:
+        cache.clear()
+        print(f"Cleared {db_path}")
+        return
+
+    stats = cache.stats()
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = 100.0 * stats['hits'] / lookups if lookups else 0.0
+    print(f"Cache:     {db_path}")
+    print(f"Opted in:  {', '.join(settings.get('model_keys') or []) or '(none)'}")
+    print(f"Entries:   {stats['entries']} ({stats['size_mb']:.1f} / {stats['max_mb']:.0f} MB)")
+    print(f"Hits:      {stats['hits']}  misses: {stats['misses']}  hit rate: {hit_rate:.1f}%")
+    print(f"Evictions: {stats['evictions']}")
+
+if __name__ == "__main__":
+    main()
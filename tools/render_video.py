@@ -1,119 +1,133 @@
 import argparse
+import glob
+import hashlib
 import json
 import os
 import subprocess
 import sys
+import yaml
+from concurrent.futures import ThreadPoolExecutor
 
-def render_video(episode_id, episodes_dir="episodes"):
+# Allow running as a script from the project root
+sys.path.append(os.getcwd())
+
+from utils.tracing import span, episode_tracer, use_tracer, run_in_context
+from utils.asset_store import content_key
+
+# Two render modes (render.mode in settings.yaml):
+# - single: one ffmpeg process encodes the whole episode.
+# - segmented: every timeline segment is encoded to its own video-only file,
+#   several ffmpeg processes at a time, with identical codec parameters and
+#   frame-exact lengths; the narration is encoded once, and the parts are
+#   joined with a stream-copy concat. Encode time then scales with cores.
+#   Parts are kept under <episode>/render, named by a key over their input
+#   files' contents, clip timings and encoder settings, so a re-render only
+#   encodes the segments whose images or timing changed.
+
+def load_config():
+    with open("config/settings.yaml", "r") as f:
+        return yaml.safe_load(f)
+
+def _resolve(path, episode_path, kind):
+    """
+    Finds a timeline asset: absolute, relative to the CWD, relative to the
+    episode, or by file name under the episode's assets/<kind>.
+    """
+    if os.path.isabs(path) or os.path.exists(path):
+        return path
+    joined_path = os.path.join(episode_path, path)
+    if os.path.exists(joined_path):
+        return joined_path
+    assets_path = os.path.join(episode_path, "assets", kind, os.path.basename(path))
+    if os.path.exists(assets_path):
+        return assets_path
+    return path
+
+def _concat_path(path):
+    # FFmpeg concat format (use absolute paths)
+    return os.path.abspath(path).replace('\\', '/')
+
+def _write_audio_list(audio_tracks, episode_path, list_path):
+    """Concat list of the narration chunks that exist. Returns their paths."""
+    paths = []
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for clip in audio_tracks:
+            audio_path = _resolve(clip.get('audio_file'), episode_path, "audio")
+            if not os.path.exists(audio_path):
+                print(f"WARNING: Audio file not found: {audio_path}")
+                continue # Skip missing audio files
+            paths.append(audio_path)
+            f.write(f"file '{_concat_path(audio_path)}'\n")
+    return paths
+
+def render_video(episode_id, episodes_dir="episodes", settings=None):
+    settings = settings or {}
     episode_path = os.path.join(episodes_dir, episode_id)
     timeline_path = os.path.join(episode_path, "timeline.json")
     output_path = os.path.join(episode_path, "final_video.mp4")
-    
+
     if not os.path.exists(timeline_path):
         print(f"ERROR: Timeline not found at {timeline_path}")
         return
 
     with open(timeline_path, 'r') as f:
         timeline = json.load(f)
-        
+
     print(f"Rendering {episode_id} to {output_path}...")
-    
-    # Build FFmpeg filter complex
-    # This is a simplified renderer that concatenates visuals and mixes audio
-    # A robust implementation would handle complex transitions and layers
-    
-    # 1. Generate a file list for visual concatenation
-    # We'll assume a simple sequence of images for now
-    
+
     video_tracks = timeline.get('tracks', {}).get('video', [])
     audio_tracks = timeline.get('tracks', {}).get('audio', [])
-    
+
     if not video_tracks:
         print("ERROR: No video tracks found.")
         return
 
+    if settings.get('mode', 'single') == 'segmented':
+        try:
+            render_segmented(timeline, episode_path, output_path, settings)
+        except FileNotFoundError:
+            print("ERROR: FFmpeg not found in PATH.")
+        return
+
+    # Build FFmpeg filter complex
+    # This is a simplified renderer that concatenates visuals and mixes audio
+    # A robust implementation would handle complex transitions and layers
+
+    # 1. Generate a file list for visual concatenation
+    # We'll assume a simple sequence of images for now
+
     # Create a temporary concat file for ffmpeg
     concat_list_path = os.path.join(episode_path, "video_concat.txt")
+    input_bytes = 0
     with open(concat_list_path, 'w', encoding='utf-8') as f:
         for clip in video_tracks:
-            image_path = clip.get('image_file')
-            
-            # Fix path logic: 
-            # If path is absolute, use it.
-            # If it exists relative to CWD, use it.
-            # If not, try joining with episode_path.
-            
-            if not os.path.isabs(image_path):
-                if os.path.exists(image_path):
-                    pass # Use as is (relative to CWD)
-                else:
-                    joined_path = os.path.join(episode_path, image_path)
-                    if os.path.exists(joined_path):
-                        image_path = joined_path
-                    else:
-                        # Fallback: try to find it in assets/images assuming image_path is just filename
-                        filename = os.path.basename(image_path)
-                        assets_path = os.path.join(episode_path, "assets", "images", filename)
-                        if os.path.exists(assets_path):
-                             image_path = assets_path
-            
+            image_path = _resolve(clip.get('image_file'), episode_path, "images")
+
             if not os.path.exists(image_path):
                 print(f"WARNING: Image file not found: {image_path}")
-            
+            else:
+                input_bytes += os.path.getsize(image_path)
+
             duration = clip.get('end_time_sec', 0) - clip.get('start_time_sec', 0)
-            
-            # FFmpeg concat format (use absolute paths)
-            abs_path = os.path.abspath(image_path).replace('\\', '/')
-            f.write(f"file '{abs_path}'\n")
+
+            f.write(f"file '{_concat_path(image_path)}'\n")
             f.write(f"duration {duration}\n")
-            
+
         # Repeat last image to prevent cut-off
-        last_clip = video_tracks[-1]
-        last_path = last_clip.get('image_file')
-        # Apply same logic for last clip
-        if not os.path.isabs(last_path):
-             if os.path.exists(last_path):
-                 pass
-             else:
-                 last_path = os.path.join(episode_path, last_path)
-                 
-        abs_last_path = os.path.abspath(last_path).replace('\\', '/')
-        f.write(f"file '{abs_last_path}'\n")
+        last_path = _resolve(video_tracks[-1].get('image_file'), episode_path, "images")
+        f.write(f"file '{_concat_path(last_path)}'\n")
 
     # 2. Construct Audio Mix
-    # For simplicity, we will concatenate audio chunks. 
+    # For simplicity, we will concatenate audio chunks.
     # A real timeline needs precise mixing at timestamps.
     # Here we assume audio chunks are sequential and roughly match video.
-    
-    audio_concat_path = os.path.join(episode_path, "audio_concat.txt")
-    with open(audio_concat_path, 'w', encoding='utf-8') as f:
-        for clip in audio_tracks:
-            audio_path = clip.get('audio_file')
-            
-            if not os.path.isabs(audio_path):
-                if os.path.exists(audio_path):
-                    pass
-                else:
-                    joined_path = os.path.join(episode_path, audio_path)
-                    if os.path.exists(joined_path):
-                        audio_path = joined_path
-                    else:
-                         filename = os.path.basename(audio_path)
-                         assets_path = os.path.join(episode_path, "assets", "audio", filename)
-                         if os.path.exists(assets_path):
-                             audio_path = assets_path
-
-            if not os.path.exists(audio_path):
-                print(f"WARNING: Audio file not found: {audio_path}")
-                continue # Skip missing audio files
 
-            # Use clean absolute paths with forward slashes
-            abs_path = os.path.abspath(audio_path).replace('\\', '/')
-            f.write(f"file '{abs_path}'\n")
+    audio_concat_path = os.path.join(episode_path, "audio_concat.txt")
+    input_bytes += sum(os.path.getsize(p) for p in _write_audio_list(audio_tracks, episode_path, audio_concat_path))
 
     # 3. Run FFmpeg
     # Command: ffmpeg -f concat -safe 0 -i video.txt -f concat -safe 0 -i audio.txt -c:v libx264 -c:a aac -pix_fmt yuv420p out.mp4
-    
+
     cmd = [
         "ffmpeg",
         "-y", # Overwrite
@@ -124,21 +138,21 @@ def render_video(episode_id, episodes_dir="episodes"):
         "-shortest", # Stop when shortest stream ends
         output_path
     ]
-    
+
     print(f"Running FFmpeg: {' '.join(cmd)}")
     try:
-        subprocess.run(cmd, check=True)
+        _run_ffmpeg(cmd, output_path, mode="video+audio", bytes_in=input_bytes)
         print("Render complete.")
     except subprocess.CalledProcessError as e:
         print(f"FFmpeg failed with audio: {e}")
         print("Retrying video-only render due to potential audio corruption/missing files...")
-        
+
         # Remove audio inputs and mapping
-        # Indexes in cmd: 
+        # Indexes in cmd:
         # 0: ffmpeg, 1: -y, 2: -f, 3: concat, 4: -safe, 5: 0, 6: -i, 7: video_list
         # 8: -f, 9: concat, 10: -safe, 11: 0, 12: -i, 13: audio_list
         # We want to keep up to index 7, then skip 8-13, then keep the rest (-c:v ...)
-        
+
         # Cleaner construction:
         cmd_video_only = [
             "ffmpeg",
@@ -146,13 +160,13 @@ def render_video(episode_id, episodes_dir="episodes"):
             "-f", "concat", "-safe", "0", "-i", concat_list_path,
             "-c:v", "libx264", "-r", "30", "-pix_fmt", "yuv420p",
             # Remove audio codec args
-            # "-c:a", "aac", "-b:a", "192k", 
+            # "-c:a", "aac", "-b:a", "192k",
             "-shortest",
             output_path
         ]
-        
+
         try:
-            subprocess.run(cmd_video_only, check=True)
+            _run_ffmpeg(cmd_video_only, output_path, mode="video-only", bytes_in=input_bytes)
             print("Video-only render complete (Audio omitted due to errors).")
         except subprocess.CalledProcessError as e2:
              print(f"FFmpeg video-only render also failed: {e2}")
@@ -160,9 +174,197 @@ def render_video(episode_id, episodes_dir="episodes"):
     except FileNotFoundError:
         print("ERROR: FFmpeg not found in PATH.")
 
+def _segments(video_tracks, clips_per_segment):
+    """
+    Runs of consecutive clips from the same timeline segment. Timelines
+    without segment ids are cut every clips_per_segment clips.
+    """
+    groups = []
+    for index, clip in enumerate(video_tracks):
+        key = clip.get('segment_id') or f"part_{index // clips_per_segment + 1:03d}"
+        if groups and groups[-1][0] == key:
+            groups[-1][1].append(clip)
+        else:
+            groups.append((key, [clip]))
+    return groups
+
+def _file_digest(path):
+    if not os.path.exists(path):
+        return f"missing:{path}"
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _video_args(settings, frame_rate, resolution):
+    """Filter and encoder arguments, the same for every segment so the parts can be stream-copied."""
+    width, height = int(resolution.get('width', 1920)), int(resolution.get('height', 1080))
+    return [
+        "-vf", (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={frame_rate}"),
+        "-c:v", "libx264",
+        "-preset", str(settings.get('preset', 'medium')),
+        "-crf", str(settings.get('crf', 20)),
+        "-pix_fmt", "yuv420p",
+        "-r", str(frame_rate),
+    ]
+
+def _segment_job(key, clips, index, first_frame, frame_rate, episode_path, work_dir, video_args):
+    """Writes the segment's image list and describes its encode."""
+    list_path = os.path.join(work_dir, f"segment_{index:03d}.txt")
+    input_bytes = 0
+    inputs = []
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for clip in clips:
+            image_path = _resolve(clip.get('image_file'), episode_path, "images")
+            if not os.path.exists(image_path):
+                print(f"WARNING: Image file not found: {image_path}")
+            else:
+                input_bytes += os.path.getsize(image_path)
+            duration = round(clip.get('end_time_sec', 0) - clip.get('start_time_sec', 0), 3)
+            inputs.append((_file_digest(image_path), duration))
+            f.write(f"file '{_concat_path(image_path)}'\n")
+            f.write(f"duration {duration}\n")
+        # Repeat last image to prevent cut-off
+        f.write(f"file '{_concat_path(image_path)}'\n")
+
+    # Whole frames on the episode's clock, so rounding doesn't add up across segments
+    end_frame = round(float(clips[-1].get('end_time_sec', 0)) * frame_rate)
+    frames = max(end_frame - first_frame, 1)
+    cache_key = content_key(images=inputs, frames=frames, args=video_args)
+    return {
+        "segment": key,
+        "list": list_path,
+        "output": os.path.join(work_dir, f"seg-{cache_key}.mp4"),
+        "frames": frames,
+        "end_frame": end_frame,
+        "bytes_in": input_bytes,
+    }
+
+def _cached(path):
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+def _encode_segment(job, video_args, threads):
+    # Written under a temporary name, so an interrupted encode is never reused
+    partial = job['output'][:-len(".mp4")] + ".part.mp4"
+    cmd = ["ffmpeg", "-y", "-loglevel", "error",
+           "-f", "concat", "-safe", "0", "-i", job['list'],
+           "-an", *video_args, "-threads", str(threads), "-frames:v", str(job['frames']), partial]
+    _run_ffmpeg(cmd, partial, mode="segment", bytes_in=job['bytes_in'], segment=job['segment'], frames=job['frames'])
+    os.replace(partial, job['output'])
+    return job['output']
+
+def _prune(work_dir, keep):
+    """Deletes rendered parts no longer in the timeline."""
+    for path in glob.glob(os.path.join(work_dir, "seg-*")) + glob.glob(os.path.join(work_dir, "narration-*")):
+        if path not in keep:
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"WARNING: Could not remove stale render part {path}: {e}")
+
+def render_segmented(timeline, episode_path, output_path, settings):
+    video_tracks = timeline.get('tracks', {}).get('video', [])
+    audio_tracks = timeline.get('tracks', {}).get('audio', [])
+    frame_rate = int(timeline.get('frame_rate') or 30)
+    resolution = timeline.get('resolution') or {}
+
+    work_dir = os.path.join(episode_path, "render")
+    os.makedirs(work_dir, exist_ok=True)
+
+    video_args = _video_args(settings, frame_rate, resolution)
+    jobs = []
+    first_frame = round(float(video_tracks[0].get('start_time_sec', 0)) * frame_rate)
+    for index, (key, clips) in enumerate(_segments(video_tracks, int(settings.get('clips_per_segment', 4)))):
+        job = _segment_job(key, clips, index, first_frame, frame_rate, episode_path, work_dir, video_args)
+        jobs.append(job)
+        first_frame = job['end_frame']
+
+    use_cache = settings.get('cache', True)
+    # Identical segments (a repeated still of the same length) share one part;
+    # it is encoded once and listed in the concat for each of them
+    unique = {}
+    for job in jobs:
+        unique.setdefault(job['output'], job)
+    dirty = [job for job in unique.values() if not (use_cache and _cached(job['output']))]
+    cores = os.cpu_count() or 1
+    workers = max(1, min(int(settings.get('workers') or cores), len(dirty) or 1))
+    print(f"Encoding {len(dirty)} of {len(jobs)} segments ({len(jobs) - len(dirty)} unchanged or repeated), {workers} at a time")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Cores are shared out between the encodes running at once
+        futures = [run_in_context(executor, _encode_segment, job, video_args, max(1, cores // workers)) for job in dirty]
+        failed = []
+        for job, future in zip(dirty, futures):
+            try:
+                future.result()
+            except subprocess.CalledProcessError as e:
+                print(f"ERROR: Segment {job['segment']} failed to encode: {e}")
+                failed.append(job['segment'])
+    if failed:
+        print(f"Render aborted: {len(failed)} of {len(jobs)} segments failed")
+        return
+
+    segments_list = os.path.join(work_dir, "segments.txt")
+    with open(segments_list, 'w', encoding='utf-8') as f:
+        for job in jobs:
+            f.write(f"file '{_concat_path(job['output'])}'\n")
+
+    audio_path = _encode_audio(audio_tracks, episode_path, work_dir, use_cache)
+
+    cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", segments_list]
+    if audio_path:
+        cmd += ["-i", audio_path, "-map", "0:v", "-map", "1:a", "-shortest"]
+    cmd += ["-c", "copy", "-movflags", "+faststart", output_path]
+    print(f"Running FFmpeg: {' '.join(cmd)}")
+    try:
+        _run_ffmpeg(cmd, output_path, mode="concat")
+    except subprocess.CalledProcessError as e:
+        print(f"FFmpeg concat failed: {e}")
+        return
+    _prune(work_dir, {job['output'] for job in jobs} | {audio_path})
+    print("Render complete." if audio_path else "Video-only render complete (Audio omitted due to errors).")
+
+def _encode_audio(audio_tracks, episode_path, work_dir, use_cache=True):
+    """The narration as one AAC track. Returns its path, or None if there is none or it failed."""
+    list_path = os.path.join(work_dir, "audio_concat.txt")
+    paths = _write_audio_list(audio_tracks, episode_path, list_path)
+    if not paths:
+        return None
+    input_bytes = sum(os.path.getsize(p) for p in paths)
+    args = ["-vn", "-c:a", "aac", "-b:a", "192k"]
+    output = os.path.join(work_dir, f"narration-{content_key(audio=[_file_digest(p) for p in paths], args=args)}.m4a")
+    if use_cache and _cached(output):
+        print("Narration unchanged; reusing its encode")
+        return output
+
+    partial = output[:-len(".m4a")] + ".part.m4a"
+    cmd = ["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path, *args, partial]
+    try:
+        _run_ffmpeg(cmd, partial, mode="audio", bytes_in=input_bytes)
+    except subprocess.CalledProcessError as e:
+        print(f"FFmpeg failed with audio: {e}")
+        return None
+    os.replace(partial, output)
+    return output
+
+def _run_ffmpeg(cmd, output_path, mode, bytes_in=0, **attrs):
+    with span("ffmpeg", kind="render", mode=mode, bytes_in=bytes_in, **attrs) as call:
+        subprocess.run(cmd, check=True)
+        if os.path.exists(output_path):
+            call.set(bytes_out=os.path.getsize(output_path))
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--episode_id", required=True)
+    parser.add_argument("--mode", choices=["single", "segmented"], help="Overrides render.mode in settings.yaml")
     args = parser.parse_args()
-    
-    render_video(args.episode_id)
+
+    settings = dict(load_config().get('render', {}) or {})
+    if args.mode:
+        settings['mode'] = args.mode
+
+    tracer = episode_tracer(os.path.join("episodes", args.episode_id), episode=args.episode_id)
+    with use_tracer(tracer):
+        render_video(args.episode_id, settings=settings)
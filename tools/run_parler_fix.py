@@ -1,7 +1,3 @@
-import torch
-from parler_tts import ParlerTTSForConditionalGeneration
-from transformers import AutoTokenizer
-import soundfile as sf
 import os
 import json
 import yaml
@@ -9,18 +5,29 @@ import yaml
 # Global model cache
 _MODEL = None
 _TOKENIZER = None
-_DEVICE = "cuda:0" if torch.cuda.is_available() else "cpu"
+_DEVICE = None
+
+def get_device():
+    # torch is only imported once a model is actually needed
+    global _DEVICE
+    if _DEVICE is None:
+        import torch
+        _DEVICE = "cuda:0" if torch.cuda.is_available() else "cpu"
+    return _DEVICE
 
 def get_parler_model():
     global _MODEL, _TOKENIZER
     if _MODEL is None:
+        from parler_tts import ParlerTTSForConditionalGeneration
+        from transformers import AutoTokenizer
+
         # Local path we downloaded to
         model_name = "models/parler-tts-mini-v1"
         if not os.path.exists(model_name):
             raise FileNotFoundError(f"Parler model not found at {model_name}")
             
-        print(f"Loading Parler-TTS from {model_name} on {_DEVICE}...")
-        _MODEL = ParlerTTSForConditionalGeneration.from_pretrained(model_name).to(_DEVICE)
+        print(f"Loading Parler-TTS from {model_name} on {get_device()}...")
+        _MODEL = ParlerTTSForConditionalGeneration.from_pretrained(model_name).to(get_device())
         _TOKENIZER = AutoTokenizer.from_pretrained(model_name)
     return _MODEL, _TOKENIZER
 
@@ -28,8 +35,8 @@ def generate_parler_audio(text, description, output_path):
     model, tokenizer = get_parler_model()
     
     # Tokenize
-    input_ids = tokenizer(description, return_tensors="pt").input_ids.to(_DEVICE)
-    prompt_input_ids = tokenizer(text, return_tensors="pt").input_ids.to(_DEVICE)
+    input_ids = tokenizer(description, return_tensors="pt").input_ids.to(get_device())
+    prompt_input_ids = tokenizer(text, return_tensors="pt").input_ids.to(get_device())
     
     # Generate
     generation = model.generate(
@@ -45,6 +52,7 @@ def generate_parler_audio(text, description, output_path):
     
     # Ensure dir exists
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    import soundfile as sf
     sf.write(output_path, audio_arr, sample_rate)
     return output_path
 
@@ -1,9 +1,10 @@
 import os
 import sys
-import soundfile as sf
-from kokoro_onnx import Kokoro
 
 def sample_all_males():
+    import soundfile as sf
+    from kokoro_onnx import Kokoro
+
     model_path = "models/kokoro/kokoro-v0_19.int8.onnx"
     voices_path = "models/kokoro/voices.bin"
     kokoro = Kokoro(model_path, voices_path)
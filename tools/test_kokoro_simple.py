@@ -1,7 +1,5 @@
 import os
 import sys
-import soundfile as sf
-from kokoro_onnx import Kokoro
 
 # Ensure we are in the right directory context if run from root
 if not os.path.exists("models"):
@@ -9,6 +7,9 @@ if not os.path.exists("models"):
     sys.exit(1)
 
 def test_local_tts():
+    import soundfile as sf
+    from kokoro_onnx import Kokoro
+
     print("--- Testing Local Kokoro TTS ---")
     
     model_path = "models/kokoro/kokoro-v0_19.int8.onnx"
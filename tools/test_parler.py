@@ -1,10 +1,11 @@
-import torch
-from parler_tts import ParlerTTSForConditionalGeneration
-from transformers import AutoTokenizer
-import soundfile as sf
 import os
 
 def test_parler():
+    import torch
+    from parler_tts import ParlerTTSForConditionalGeneration
+    from transformers import AutoTokenizer
+    import soundfile as sf
+
     print("--- Testing Parler-TTS ---")
     
     device = "cuda:0" if torch.cuda.is_available() else "cpu"
@@ -1,13 +1,14 @@
 import os
 import yaml
-from google import genai
-from google.genai import types
 
 def load_config():
     with open("config/settings.yaml", "r") as f:
         return yaml.safe_load(f)
 
 def test_key():
+    from google import genai
+    from google.genai import types
+
     config = load_config()
     api_key = config.get('google', {}).get('api_key')
     
@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import sys
+
+TRACE_FILE = "trace.jsonl"
+
+def load_spans(path, run_id=None):
+    """Reads spans for one run (the most recent one unless run_id is given)."""
+    spans = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+
+    if not spans:
+        return []
+    if run_id is None:
+        run_id = max(spans, key=lambda s: s['end'])['run_id']
+    return [s for s in spans if s.get('run_id') == run_id]
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def _owning_stage(span, by_id):
+    current = span
+    while current is not None:
+        if current['kind'] == 'stage':
+            return current['name']
+        current = by_id.get(current.get('parent_id'))
+    return "(outside stages)"
+
+def summarize(spans):
+    by_id = {s['span_id']: s for s in spans}
+    episode = next((s for s in spans if s['kind'] == 'episode'), None)
+    if episode:
+        wall_ms = episode['duration_ms']
+    else:
+        wall_ms = (max(s['end'] for s in spans) - min(s['start'] for s in spans)) * 1000
+
+    stages = {}
+    for s in spans:
+        if s['kind'] == 'stage':
+            stages[s['name']] = {
+                "start": s['start'], "wall_ms": s['duration_ms'], "status": s['status'],
+                "calls": 0, "call_ms": 0.0, "retries": 0, "bytes_in": 0, "bytes_out": 0,
+            }
+
+    calls = {}
+    for s in spans:
+        if s['kind'] in ('stage', 'episode', 'internal'):
+            continue
+        stage = stages.setdefault(_owning_stage(s, by_id), {
+            "start": s['start'], "wall_ms": 0.0, "status": "ok",
+            "calls": 0, "call_ms": 0.0, "retries": 0, "bytes_in": 0, "bytes_out": 0,
+        })
+        stage['calls'] += 1
+        stage['call_ms'] += s['duration_ms']
+        stage['retries'] += s.get('retries', 0)
+        stage['bytes_in'] += s.get('bytes_in', 0)
+        stage['bytes_out'] += s.get('bytes_out', 0)
+
+        key = (s['kind'], s.get('model') or s['name'])
+        calls.setdefault(key, []).append(s)
+
+    return wall_ms, stages, calls
+
+def print_report(spans):
+    wall_ms, stages, calls = summarize(spans)
+    episode = spans[0].get('episode', '?')
+    print(f"Episode: {episode}   run: {spans[0].get('run_id')}   wall time: {wall_ms / 1000:.2f}s")
+    root = next((s for s in spans if s['kind'] == 'episode'), None)
+    if root and 'startup_ms' in root:
+        print(f"Startup: {root['startup_ms']:.0f} ms")
+
+    print("\nPer-stage breakdown (stages overlap when they run concurrently)")
+    header = f"{'stage':<24}{'wall s':>9}{'% wall':>8}{'calls':>7}{'call s':>9}{'retries':>9}{'in KB':>10}{'out KB':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, st in sorted(stages.items(), key=lambda item: item[1]['start']):
+        share = 100.0 * st['wall_ms'] / wall_ms if wall_ms else 0.0
+        flag = "" if st['status'] == 'ok' else "  (failed)"
+        print(f"{name:<24}{st['wall_ms'] / 1000:>9.2f}{share:>7.1f}%{st['calls']:>7}"
+              f"{st['call_ms'] / 1000:>9.2f}{st['retries']:>9}"
+              f"{st['bytes_in'] / 1024:>10.1f}{st['bytes_out'] / 1024:>10.1f}{flag}")
+
+    if calls:
+        print("\nPer-call latency")
+        header = f"{'kind':<8}{'model':<32}{'n':>5}{'total s':>9}{'p50 s':>8}{'p95 s':>8}{'max s':>8}{'errors':>8}{'retries':>9}{'cached':>8}"
+        print(header)
+        print("-" * len(header))
+        for (kind, model), items in sorted(calls.items()):
+            durations = [s['duration_ms'] / 1000 for s in items]
+            errors = sum(1 for s in items if s['status'] != 'ok')
+            retries = sum(s.get('retries', 0) for s in items)
+            cached = sum(1 for s in items if s.get('cache') == 'hit')
+            print(f"{kind:<8}{model[:31]:<32}{len(items):>5}{sum(durations):>9.2f}"
+                  f"{_percentile(durations, 50):>8.2f}{_percentile(durations, 95):>8.2f}"
+                  f"{max(durations):>8.2f}{errors:>8}{retries:>9}{cached:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize an episode trace.jsonl into a per-stage latency breakdown")
+    parser.add_argument("target", help="Episode name, episode directory or path to a trace.jsonl")
+    parser.add_argument("--run", help="run_id to summarize (defaults to the most recent run)")
+    parser.add_argument("--episodes_dir", default="episodes")
+    args = parser.parse_args()
+
+    path = args.target
+    if os.path.isdir(path):
+        path = os.path.join(path, TRACE_FILE)
+    elif not os.path.exists(path):
+        path = os.path.join(args.episodes_dir, args.target, TRACE_FILE)
+
+    if not os.path.exists(path):
+        print(f"ERROR: Trace not found at {path}")
+        sys.exit(1)
+
+    spans = load_spans(path, args.run)
+    if not spans:
+        print(f"ERROR: No spans recorded in {path}")
+        sys.exit(1)
+    print_report(spans)
+
+if __name__ == "__main__":
+    main()
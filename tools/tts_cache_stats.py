@@ -0,0 +1,29 @@
+import os
+import sys
+import yaml
+
+sys.path.append(os.getcwd())
+
+from utils.tts_cache import PhraseCache
+
+def load_config():
+    with open("config/settings.yaml", "r") as f:
+        return yaml.safe_load(f)
+
+def main():
+    settings = load_config().get('tts_cache', {}) or {}
+    root = settings.get('root', os.path.join('.cache', 'tts'))
+    if not os.path.exists(os.path.join(root, 'index.sqlite')):
+        print(f"No TTS cache at {root}")
+        return
+
+    stats = PhraseCache(root, max_mb=settings.get('max_mb', 2048)).stats()
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = 100.0 * stats['hits'] / lookups if lookups else 0.0
+    print(f"Cache:     {root}")
+    print(f"Phrases:   {stats['entries']} ({stats['size_mb']:.1f} / {stats['max_mb']:.0f} MB)")
+    print(f"Hits:      {stats['hits']}  misses: {stats['misses']}  hit rate: {hit_rate:.1f}%")
+    print(f"Evictions: {stats['evictions']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+# Content-addressed store for generated media, shared by every episode.
+# Files live at <root>/<first two hex chars>/<sha256><ext>, keyed by the
+# hash of whatever determined their content (model, prompt, request config).
+# Episode assets are hardlinks into it, so a repeated prompt costs a link
+# instead of an API call and the bytes exist on disk once.
+
+_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.wav', '.mp3')
+
+def content_key(**parts):
+    """Stable sha256 over the given fields (order-independent)."""
+    blob = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+def link_or_copy(src, dest):
+    """Atomically places src at dest as a hardlink, copying if links aren't possible."""
+    directory = os.path.dirname(dest) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(dest) + ".", suffix=".part")
+    os.close(fd)
+    os.remove(tmp)
+    try:
+        try:
+            os.link(src, tmp)
+        except OSError:
+            # Different filesystem, or one without hardlinks
+            shutil.copy2(src, tmp)
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+class AssetStore:
+    def __init__(self, root):
+        self.root = root
+
+    def _base(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def lookup(self, key):
+        """Path of the stored file for key, or None."""
+        base = self._base(key)
+        for ext in _EXTENSIONS:
+            if os.path.exists(base + ext):
+                return base + ext
+        return None
+
+    def fetch(self, key, output_path):
+        """
+        Links the stored file for key to output_path (taking the stored
+        file's extension). Returns the path used, or None on a miss.
+        """
+        stored = self.lookup(key)
+        if stored is None:
+            return None
+        final_path = os.path.splitext(output_path)[0] + os.path.splitext(stored)[1]
+        link_or_copy(stored, final_path)
+        return final_path
+
+    def add(self, key, path):
+        """Adopts a freshly generated file into the store."""
+        if self.lookup(key) is not None:
+            return
+        link_or_copy(path, self._base(key) + os.path.splitext(path)[1].lower())
+
+def from_config(config):
+    """Builds the store from the `asset_store` section of settings.yaml, or None if disabled."""
+    settings = config.get('asset_store', {}) or {}
+    if not settings.get('enabled', False):
+        return None
+    return AssetStore(settings.get('root', os.path.join('.cache', 'assets')))
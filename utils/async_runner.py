@@ -0,0 +1,74 @@
+import asyncio
+import itertools
+import threading
+import contextvars
+
+# One long-lived event loop for all async API work in the process. Stages run
+# in their own pipeline threads and hand their coroutines to it with run(),
+# instead of each starting a loop of its own with asyncio.run(): the GenAI
+# client's async HTTP connections are pooled per client, and a pooled
+# connection must not be reused from a different (or already closed) loop.
+
+_LOOP = None
+_LOCK = threading.Lock()
+_STOP = object()
+
+def _loop():
+    global _LOOP
+    if _LOOP is None:
+        with _LOCK:
+            if _LOOP is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="api-event-loop", daemon=True).start()
+                _LOOP = loop
+    return _LOOP
+
+async def _in_context(coro, ctx):
+    # Tasks copy the context they are created in, so the caller's tracer and span carry over
+    task = ctx.run(asyncio.ensure_future, coro)
+    return await task
+
+def run(coro):
+    """
+    Runs coro on the shared event loop and waits for its result, from any
+    thread but the loop's own. If the caller is interrupted, the coroutine
+    is cancelled.
+    """
+    future = asyncio.run_coroutine_threadsafe(_in_context(coro, contextvars.copy_context()), _loop())
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()
+        raise
+
+async def worker_pool(handle, concurrency, jobs=(), source=None):
+    """
+    Awaits handle(item) for every item with at most concurrency running at
+    once. jobs are (rank, item) pairs and go lowest rank first (ties in
+    order); source, an async iterator of (rank, item), adds items while the
+    pool is running. Returns when every item has been handled. handle is
+    expected to deal with its own errors.
+    """
+    jobs = list(jobs)
+    queue = asyncio.PriorityQueue()
+    order = itertools.count()
+    for rank, item in jobs:
+        queue.put_nowait((rank, next(order), item))
+    workers = max(1, int(concurrency) if source is not None else min(int(concurrency), len(jobs)))
+
+    async def feed():
+        if source is not None:
+            async for rank, item in source:
+                queue.put_nowait((rank, next(order), item))
+        # Ranked after every real job, so workers drain the queue before stopping
+        for _ in range(workers):
+            queue.put_nowait((float('inf'), next(order), _STOP))
+
+    async def worker():
+        while True:
+            _, _, item = await queue.get()
+            if item is _STOP:
+                return
+            await handle(item)
+
+    await asyncio.gather(feed(), *(worker() for _ in range(workers)))
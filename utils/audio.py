@@ -0,0 +1,235 @@
+import os
+import wave
+import struct
+import tempfile
+import mimetypes
+
+DEFAULT_PCM_RATE = 24000
+
+def parse_mime(mime_type):
+    """Splits 'audio/L16;codec=pcm;rate=24000' into ('audio/l16', {'codec': 'pcm', 'rate': '24000'})."""
+    parts = [p.strip() for p in (mime_type or "").split(";") if p.strip()]
+    base = parts[0].lower() if parts else ""
+    params = {}
+    for p in parts[1:]:
+        if "=" in p:
+            key, value = p.split("=", 1)
+            params[key.strip().lower()] = value.strip()
+    return base, params
+
+def is_pcm(mime_type):
+    base, params = parse_mime(mime_type)
+    return base in ("audio/l16", "audio/pcm") or params.get("codec", "").lower() == "pcm"
+
+def is_wav(mime_type):
+    base, _ = parse_mime(mime_type)
+    return base in ("audio/wav", "audio/x-wav", "audio/wave", "audio/vnd.wave")
+
+def split_wav(data):
+    """
+    Parses an in-memory RIFF/WAVE blob. Returns (channels, rate, sample_width,
+    pcm_bytes) or None if data does not start with a WAV header.
+    """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    pos = 12
+    fmt = None
+    while pos + 8 <= len(data):
+        chunk_id, size = struct.unpack("<4sI", data[pos:pos + 8])
+        body = pos + 8
+        if chunk_id == b"fmt " and size >= 16:
+            _, channels, rate, _, _, bits = struct.unpack("<HHIIHH", data[body:body + 16])
+            fmt = (channels, rate, bits // 8)
+        elif chunk_id == b"data" and fmt is not None:
+            return fmt + (data[body:body + size],)
+        pos = body + size + (size & 1)
+    return None
+
+class AudioStreamWriter:
+    """
+    Writes streamed audio parts straight to disk.
+
+    PCM parts (and WAV parts, whose headers are stripped) are appended to a
+    single WAV file whose header is written with the sample rate from the
+    mime type. Other formats are appended as-is. Data goes to a temporary
+    file next to the target and is renamed into place on commit(), so a
+    failed or cancelled stream never leaves a truncated file behind.
+    """
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.final_path = None
+        self.bytes_written = 0
+        self._tmp_path = None
+        self._file = None
+        self._wave = None
+        self._mime = None
+
+    def _open(self, mime_type, wav_format=None):
+        base_path = os.path.splitext(self.output_path)[0]
+        pcm = wav_format is not None or is_pcm(mime_type)
+        if pcm:
+            extension = ".wav"
+        else:
+            extension = mimetypes.guess_extension(parse_mime(mime_type)[0]) or ".wav"
+        self.final_path = base_path + extension
+        self._mime = mime_type
+
+        directory = os.path.dirname(self.final_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.final_path) + ".", suffix=".part")
+        # mkstemp creates the file owner-only; assets should read like any other file
+        os.fchmod(fd, 0o644)
+        self._file = os.fdopen(fd, "wb")
+
+        if pcm:
+            if wav_format is None:
+                _, params = parse_mime(mime_type)
+                rate = int(params.get("rate", DEFAULT_PCM_RATE))
+                channels = int(params.get("channels", 1))
+                wav_format = (channels, rate, 2)
+            channels, rate, sample_width = wav_format
+            self._wave = wave.open(self._file, "wb")
+            self._wave.setnchannels(channels)
+            self._wave.setsampwidth(sample_width)
+            self._wave.setframerate(rate)
+
+    def write(self, data, mime_type):
+        wav = split_wav(data) if is_wav(mime_type) or data[:4] == b"RIFF" else None
+        if self._file is None:
+            self._open(mime_type, wav_format=wav[:3] if wav else None)
+        elif parse_mime(mime_type)[0] != parse_mime(self._mime)[0]:
+            raise RuntimeError(f"Audio stream changed format mid-stream ({self._mime} -> {mime_type})")
+
+        if self._wave is not None:
+            pcm = wav[3] if wav else data
+            self._wave.writeframesraw(pcm)
+            self.bytes_written += len(pcm)
+        else:
+            self._file.write(data)
+            self.bytes_written += len(data)
+
+    def commit(self):
+        """Finalizes the header and atomically moves the file into place. Returns its path."""
+        if self._file is None or self.bytes_written == 0:
+            self.discard()
+            raise RuntimeError("No audio bytes found in response stream.")
+        if self._wave is not None:
+            # Rewrites the RIFF/data sizes in the header
+            self._wave.close()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self.final_path)
+        self._tmp_path = None
+        return self.final_path
+
+    def discard(self):
+        if self._wave is not None:
+            try:
+                self._wave.close()
+            except Exception:
+                pass
+            self._wave = None
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        if self._tmp_path and os.path.exists(self._tmp_path):
+            try:
+                os.remove(self._tmp_path)
+            except OSError:
+                pass
+        self._tmp_path = None
+
+# --- Durations, read from file headers (no decoding, no ffprobe) ---
+
+def wav_duration(path):
+    """Seconds of audio in a WAV file, from its fmt and data chunks. None if not a WAV."""
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            return None
+        file_size = os.fstat(f.fileno()).st_size
+        byte_rate = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, size = struct.unpack("<4sI", chunk)
+            if chunk_id == b"fmt ":
+                body = f.read(size)
+                if len(body) < 16:
+                    return None
+                _, _, _, byte_rate, _, _ = struct.unpack("<HHIIHH", body[:16])
+                if size & 1:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if not byte_rate:
+                    return None
+                # Streamed WAVs may carry a placeholder size; trust the file
+                available = file_size - f.tell()
+                if size == 0 or size > available:
+                    size = available
+                return size / float(byte_rate)
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+
+_MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 25: (11025, 12000, 8000)}
+
+def _mp3_frame(header):
+    """(frame bytes, samples, sample rate) for a 4-byte MPEG audio frame header, or None."""
+    b1, b2, b3 = header[1], header[2], header[3]
+    if header[0] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = {3: 1, 2: 2, 0: 25}.get((b1 >> 3) & 0x3)
+    layer = {3: 1, 2: 2, 1: 3}.get((b1 >> 1) & 0x3)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x3
+    if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    rate = _MP3_RATES[version][rate_index]
+    padding = (b2 >> 1) & 0x1
+    if layer == 1:
+        return (12 * bitrate // rate + padding) * 4, 384, rate
+    samples = 1152 if layer == 2 or version == 1 else 576
+    return samples // 8 * bitrate // rate + padding, samples, rate
+
+def mp3_duration(path):
+    """Seconds of audio in an MP3, summed over its frame headers. None if no frames are found."""
+    with open(path, "rb") as f:
+        data = f.read()
+    pos = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        # ID3v2 tag size is a 28-bit syncsafe integer
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        pos = 10 + size
+    seconds = 0.0
+    frames = 0
+    while pos + 4 <= len(data):
+        frame = _mp3_frame(data[pos:pos + 4])
+        if frame is None or frame[0] <= 4:
+            if frames:
+                break  # trailing tags (ID3v1, APE)
+            pos += 1  # resync to the first frame
+            continue
+        length, samples, rate = frame
+        seconds += samples / float(rate)
+        frames += 1
+        pos += length
+    return seconds if frames else None
+
+def duration_sec(path):
+    """Duration of a WAV or MP3 file in seconds, or None if it can't be read."""
+    try:
+        if os.path.splitext(path)[1].lower() == ".mp3":
+            return mp3_duration(path)
+        return wav_duration(path) or mp3_duration(path)
+    except OSError:
+        return None
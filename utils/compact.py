@@ -0,0 +1,130 @@
+import copy
+import json
+import threading
+
+# Serialization of agent inputs for prompts. Inputs go out minified and cut
+# down to the fields each agent's prompt actually reads (dotted paths; lists
+# are walked transparently), and are held to a per-agent token budget by
+# shortening long text fields in the middle. Token counts are estimates
+# (characters per token), which is all the budget needs and costs no call.
+
+_STATS_LOCK = threading.Lock()
+_STATS = {}
+
+def dumps(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def _tree(paths):
+    tree = {}
+    for path in paths:
+        node = tree
+        parts = path.split(".")
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+            if node is True:
+                break
+        else:
+            node[parts[-1]] = True
+    return tree
+
+def _project(data, tree):
+    if tree is True:
+        return copy.deepcopy(data)
+    if isinstance(data, list):
+        return [_project(item, tree) for item in data]
+    if isinstance(data, dict):
+        return {key: _project(data[key], sub) for key, sub in tree.items() if key in data}
+    return data
+
+def project(data, paths):
+    """Copy of data keeping only the given dotted paths (all of it if paths is None)."""
+    if paths is None:
+        return copy.deepcopy(data)
+    return _project(data, _tree(paths))
+
+def estimate_tokens(text, chars_per_token=4.0):
+    return int(len(text) / chars_per_token) + 1
+
+def _elide(text, keep):
+    omitted = len(text) - keep
+    if omitted <= 0:
+        return text
+    head = keep // 2
+    return f"{text[:head]}\n[... {omitted} characters omitted to fit the input budget ...]\n{text[len(text) - (keep - head):]}"
+
+def _shorten(data, path, excess_chars):
+    """Shortens the string at a top-level or dotted path by about excess_chars. Returns True if it did."""
+    parts = path.split(".")
+    node = data
+    for part in parts[:-1]:
+        node = node.get(part) if isinstance(node, dict) else None
+    if not isinstance(node, dict) or not isinstance(node.get(parts[-1]), str):
+        return False
+    value = node[parts[-1]]
+    node[parts[-1]] = _elide(value, max(len(value) - excess_chars, 0))
+    return True
+
+def budget_settings(config, agent_name):
+    """(max input tokens, chars per token) for an agent from the `token_budget` section."""
+    settings = config.get('token_budget', {}) or {}
+    agents = settings.get('agents', {}) or {}
+    return agents.get(agent_name, settings.get('max_input_tokens')), float(settings.get('chars_per_token', 4))
+
+def _measure(projected, shared, chars_per_token):
+    rest = {k: v for k, v in projected.items() if k != shared} if shared else projected
+    text = dumps(rest)
+    shared_text = projected.get(shared) if shared else None
+    tokens = estimate_tokens(text, chars_per_token)
+    if shared_text:
+        tokens += estimate_tokens(shared_text, chars_per_token)
+    return text, shared_text, tokens
+
+def serialize(agent_name, data, fields=None, trim=(), max_tokens=None, chars_per_token=4.0, shared=None):
+    """
+    Minified, projected JSON for data, shortened along the trim paths (in
+    order) until it fits max_tokens. A shared top-level text field is split
+    off and returned as is, to go out as a cacheable prefix, but still counts
+    against the budget. Returns (json, shared text, tokens, baseline); savings
+    against the old indented, unprojected form are recorded per agent (see
+    input_stats()).
+    """
+    projected = project(data, fields)
+    text, shared_text, tokens = _measure(projected, shared, chars_per_token)
+
+    trimmed = 0
+    if max_tokens and tokens > max_tokens:
+        for path in trim:
+            excess = int((tokens - max_tokens) * chars_per_token) + 80
+            if not _shorten(projected, path, excess):
+                continue
+            trimmed += 1
+            text, shared_text, tokens = _measure(projected, shared, chars_per_token)
+            if tokens <= max_tokens:
+                break
+        if tokens > max_tokens:
+            print(f"WARNING: {agent_name} input is ~{tokens} tokens, over its budget of {max_tokens}; sending it anyway")
+
+    baseline = estimate_tokens(json.dumps(data, indent=2, default=str), chars_per_token)
+    with _STATS_LOCK:
+        stats = _STATS.setdefault(agent_name, {"calls": 0, "tokens": 0, "baseline": 0, "trimmed": 0})
+        stats["calls"] += 1
+        stats["tokens"] += tokens
+        stats["baseline"] += baseline
+        stats["trimmed"] += trimmed
+    return text, shared_text, tokens, baseline
+
+def input_stats():
+    """Process-wide estimated input tokens per agent, sent vs. the old serialization."""
+    with _STATS_LOCK:
+        return {name: dict(stats) for name, stats in _STATS.items()}
+
+def print_input_stats():
+    stats = input_stats()
+    if not stats:
+        return
+    print("Prompt inputs (estimated tokens):")
+    for name, s in sorted(stats.items()):
+        saved = s["baseline"] - s["tokens"]
+        share = 100.0 * saved / s["baseline"] if s["baseline"] else 0.0
+        print(f"  {name:<22} calls {s['calls']}, sent {s['tokens']} of {s['baseline']} "
+              f"(saved {saved}, {share:.0f}%), trimmed fields {s['trimmed']}")
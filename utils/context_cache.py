@@ -0,0 +1,172 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from utils.asset_store import content_key
+from utils.compact import estimate_tokens
+
+# Server-side context caches (cachedContents) for prompt prefixes that many
+# calls share: an agent's system prompt, together with the episode script
+# when the agent sends it as shared context. Each prefix is uploaded once per
+# model with a TTL; later calls send only its handle. The API wants the system
+# instruction inside the cache, so the prefix is per (model, system prompt,
+# shared context). Prefixes under the model's minimum cacheable size, and
+# ones the API refuses, are sent inline as before. A prefix is only uploaded
+# once it is going to be reused: when it is seen a second time (the same
+# system prompt across a batch), or up front when the caller says several
+# calls will share it (segment shards, see expect_reuse). The caches are
+# deleted at the end of the run (close).
+
+# Handles this close to expiry are replaced rather than used
+_EXPIRY_MARGIN_SEC = 60
+# A prefix whose cache keeps vanishing is sent inline after this many re-creations
+_MAX_RECREATE = 2
+
+_EXPECTED_USES = contextvars.ContextVar("context_cache_expected_uses", default=1)
+
+@contextmanager
+def expect_reuse(uses):
+    """
+    Tells handle() that calls made in this context, and in workers started
+    from it, send the same prefix about `uses` times in all, so a prefix
+    worth caching is uploaded on its first use.
+    """
+    token = _EXPECTED_USES.set(max(int(uses), _EXPECTED_USES.get()))
+    try:
+        yield
+    finally:
+        _EXPECTED_USES.reset(token)
+
+class ContextCache:
+    def __init__(self, ttl_sec=3600, min_tokens=1024, chars_per_token=4.0):
+        self.ttl_sec = int(ttl_sec)
+        # Either one number or {model name: tokens, "default": tokens}
+        self.min_tokens = min_tokens
+        self.chars_per_token = float(chars_per_token)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = {}  # key -> (cache name, monotonic expiry)
+        self._seen = {}  # key -> calls made with the prefix
+        self._recreated = {}  # key -> times its cache was lost and made again
+        self._unusable = set()
+        self._stats = {"hits": 0, "created": 0, "skipped": 0, "single_use": 0, "failed": 0, "cached_tokens": 0, "prompt_tokens": 0}
+
+    def _count(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                self._stats[name] += value
+
+    def _min_tokens(self, model_name):
+        if isinstance(self.min_tokens, dict):
+            return int(self.min_tokens.get(model_name, self.min_tokens.get('default', 1024)))
+        return int(self.min_tokens)
+
+    def handle(self, client, model_name, system_prompt, shared_context=None):
+        """
+        Name of a live cache holding this prefix, registering it once it is
+        going to be reused. Returns None when the prefix should be sent inline.
+        """
+        size = estimate_tokens((system_prompt or "") + (shared_context or ""), self.chars_per_token)
+        if size < self._min_tokens(model_name):
+            self._count(skipped=1)
+            return None
+
+        key = content_key(model=model_name, system_prompt=system_prompt, shared_context=shared_context)
+        with self._lock:
+            unusable = key in self._unusable
+            seen = self._seen[key] = self._seen.get(key, 0) + 1
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        if unusable:
+            self._count(skipped=1)
+            return None
+
+        # One upload per prefix, however many calls arrive for it at once
+        with key_lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] - time.monotonic() > _EXPIRY_MARGIN_SEC:
+                self._count(hits=1)
+                return entry[0]
+            if entry is None and seen < 2 and _EXPECTED_USES.get() < 2:
+                # Nothing says this prefix will be sent again; an upload would cost more than it saves
+                self._count(single_use=1)
+                return None
+
+            from google.genai import types
+            from utils.google_api import governed_call
+            try:
+                # An upload is a request like any other: it waits for the model's quota and a slot
+                with governed_call(model_name):
+                    cached = client.caches.create(
+                        model=model_name,
+                        config=types.CreateCachedContentConfig(
+                            system_instruction=system_prompt,
+                            contents=[shared_context] if shared_context else None,
+                            ttl=f"{self.ttl_sec}s",
+                            display_name=f"prefix-{key[:12]}",
+                        ),
+                    )
+            except Exception as e:
+                print(f"WARNING: Could not create a context cache for {model_name} ({e}); sending the prefix inline")
+                with self._lock:
+                    self._unusable.add(key)
+                self._count(failed=1)
+                return None
+
+            print(f"DEBUG: Cached a ~{size} token prompt prefix for {model_name} ({self.ttl_sec}s)")
+            self._entries[key] = (cached.name, time.monotonic() + self.ttl_sec)
+            self._count(created=1)
+            return cached.name
+
+    def lost(self, name):
+        """
+        Forgets a handle the API no longer knows, so the next call for its
+        prefix uploads it again. A prefix lost more than _MAX_RECREATE times
+        is sent inline for the rest of the run.
+        """
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry[0] == name:
+                    del self._entries[key]
+                    self._recreated[key] = self._recreated.get(key, 0) + 1
+                    if self._recreated[key] > _MAX_RECREATE:
+                        self._unusable.add(key)
+
+    def close(self, client):
+        """Deletes every cache this registry uploaded. Returns how many were deleted."""
+        with self._lock:
+            names = [entry[0] for entry in self._entries.values()]
+            self._entries.clear()
+        deleted = 0
+        for name in names:
+            try:
+                client.caches.delete(name=name)
+                deleted += 1
+            except Exception as e:
+                # It expires on its own at the end of its TTL
+                print(f"WARNING: Could not delete context cache {name} ({e})")
+        return deleted
+
+    def record(self, usage):
+        """Adds a response's usage metadata (prompt and cache-served tokens)."""
+        if usage is None:
+            return 0
+        cached = usage.cached_content_token_count or 0
+        self._count(cached_tokens=cached, prompt_tokens=usage.prompt_token_count or 0)
+        return cached
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["live"] = sum(1 for _, expiry in self._entries.values() if expiry > time.monotonic())
+        return stats
+
+def from_config(config):
+    """Builds the registry from the `context_cache` section of settings.yaml, or None if disabled."""
+    settings = config.get('context_cache', {}) or {}
+    if not settings.get('enabled', False):
+        return None
+    return ContextCache(
+        ttl_sec=settings.get('ttl_sec', 3600),
+        min_tokens=settings.get('min_tokens', 1024),
+        chars_per_token=(config.get('token_budget', {}) or {}).get('chars_per_token', 4),
+    )
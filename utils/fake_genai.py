@@ -0,0 +1,416 @@
+import json
+import math
+import time
+import zlib
+import random
+import struct
+import asyncio
+import threading
+import collections
+
+# Offline stand-in for google.genai.Client, selected with runtime.backend:
+# "fake". It speaks the same surface our code uses (client.models and
+# client.aio.models, generate_content / generate_content_stream) and answers
+# with real SDK response objects: agent JSON shaped like the real thing, PNG
+# bytes and streamed 24 kHz PCM. Latency, 429s, 5xx, dropped streams and
+# per-minute quotas are injected per model from the `fake_backend` section of
+# settings.yaml, so throughput, backoff and scheduling can be measured
+# without a network or an API key. client.caches keeps cached contents (with
+# TTL and minimum size) and responses report usage, including tokens served
+# from a cache.
+
+_DEFAULTS = {
+    "latency_ms": {"median": 800, "p95": 2500},
+    "rate_429": 0.0,
+    "rate_5xx": 0.0,
+    "rate_drop": 0.0,
+    "rpm": 0,
+}
+PCM_RATE = 24000
+WORDS_PER_SEC = 2.5
+CHARS_PER_TOKEN = 4
+
+def _role(system_prompt):
+    """First line of an agent prompt ("You are the Image Prompt Agent ...")."""
+    for line in (system_prompt or "").splitlines():
+        if line.strip():
+            return line
+    return ""
+
+def _payload(user_prompt):
+    """The JSON document an agent appended to its user prompt, or None."""
+    start = user_prompt.find("{")
+    if start < 0:
+        return None
+    try:
+        return json.JSONDecoder().raw_decode(user_prompt[start:])[0]
+    except ValueError:
+        return None
+
+def _tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _words(rng, n):
+    vocab = ["the", "city", "of", "river", "kings", "walls", "temple", "clay", "tablets", "grain",
+             "priests", "scribes", "trade", "gods", "flood", "ancient", "people", "built", "first", "empire"]
+    return " ".join(rng.choice(vocab) for _ in range(n))
+
+class FakeText:
+    """Builds agent responses whose ids line up from stage to stage."""
+    def __init__(self, settings, rng):
+        self.segments = int(settings.get('segments', 12))
+        self.slots = int(settings.get('slots_per_segment', 4))
+        self.segment_sec = float(settings.get('segment_sec', 60))
+        self.rng = rng
+
+    def respond(self, system_prompt, user_prompt):
+        role = _role(system_prompt)
+        data = _payload(user_prompt) or {}
+        if "Structure & Timing" in role:
+            return json.dumps(self.structure())
+        if "Image Prompt" in role:
+            return json.dumps(self.image_prompts(data))
+        if "Voice-Over" in role:
+            return json.dumps(self.tts_plan(data.get('structure') or self.structure()))
+        if "QA" in role:
+            return "# QA Report\n\nNo blocking issues found.\n\n" + "\n".join(
+                f"- seg_{i + 1:02d}: {_words(self.rng, 12)}" for i in range(self.segments))
+        return self.script()
+
+    def script(self):
+        paragraphs = [f"[{i + 1}] {_words(self.rng, int(self.segment_sec * WORDS_PER_SEC))}." for i in range(self.segments)]
+        return "[1] EPISODE METADATA\n- Title: Fake Episode\n[3] FULL VOICE-OVER SCRIPT\n" + "\n\n".join(paragraphs)
+
+    def structure(self):
+        segments = []
+        for i in range(self.segments):
+            segments.append({
+                "id": f"seg_{i + 1:02d}",
+                "type": "hook" if i == 0 else "body",
+                "narration_ref": {"from_paragraph_index": i, "to_paragraph_index": i},
+                "visual_slots": [{
+                    "slot_id": f"seg_{i + 1:02d}_shot_{j + 1:02d}",
+                    "visual_concept": _words(self.rng, 6),
+                    "priority": "must_have" if j == 0 else "nice_to_have",
+                } for j in range(self.slots)],
+            })
+        return {"episode_id": "fake", "segments": segments}
+
+    def image_prompts(self, structure):
+        prompts = []
+        for seg in (structure.get('segments') or self.structure()['segments']):
+            for slot in seg.get('visual_slots', []):
+                prompts.append({
+                    "slot_id": slot.get('slot_id'),
+                    "segment_id": seg.get('id'),
+                    "start_time_sec": slot.get('start_time_sec'),
+                    "end_time_sec": slot.get('end_time_sec'),
+                    "prompt_text": f"Cinematic matte painting, {_words(self.rng, 18)}",
+                })
+        return {"episode_id": "fake", "image_prompts": prompts}
+
+    def tts_plan(self, structure):
+        chunks = []
+        for seg in structure.get('segments', []):
+            seconds = float(seg.get('end_time_sec', 0)) - float(seg.get('start_time_sec', 0)) or self.segment_sec
+            chunks.append({
+                "chunk_id": f"aud_{seg.get('id')}",
+                "segment_id": seg.get('id'),
+                "text": _words(self.rng, max(3, int(seconds * WORDS_PER_SEC))) + ".",
+                "output_file": f"audio/{seg.get('id')}.wav",
+            })
+        return {"episode_id": "fake", "voice_profile": {"engine": "google-tts"}, "audio_chunks": chunks}
+
+def png_bytes(width, height, seed):
+    """An RGB PNG of seeded noise (noise so it doesn't compress below real-file size checks)."""
+    rng = random.Random(seed)
+    rows = b"".join(b"\x00" + bytes(rng.getrandbits(8) for _ in range(width * 3)) for _ in range(height))
+
+    def chunk(kind, body):
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows, 1)) + chunk(b"IEND", b"")
+
+def pcm_bytes(seconds, seed):
+    """16-bit mono PCM at PCM_RATE: a quiet tone, so durations are real and files are valid."""
+    period = 120 + (seed % 8) * 20  # samples per cycle, 100-200 Hz
+    cycle = b"".join(struct.pack("<h", int(3000 * math.sin(2 * math.pi * i / period))) for i in range(period))
+    frames = int(seconds * PCM_RATE)
+    return (cycle * (frames // period + 1))[:frames * 2]
+
+def _prompt_text(contents):
+    """Text of a request's contents: plain strings or SDK Content objects."""
+    pieces = []
+    for item in contents if isinstance(contents, (list, tuple)) else [contents]:
+        if isinstance(item, str):
+            pieces.append(item)
+            continue
+        for part in getattr(item, 'parts', None) or []:
+            if getattr(part, 'text', None):
+                pieces.append(part.text)
+    return "\n".join(pieces)
+
+class FakeBackend:
+    """Shared state behind the sync and async fake model APIs."""
+    def __init__(self, settings):
+        self.settings = settings or {}
+        self.time_scale = float(self.settings.get('time_scale', 1.0))
+        self.chunk_chars = int(self.settings.get('stream_chunk_chars', 80))
+        self.image_size = tuple(self.settings.get('image_size', (160, 90)))
+        self._rng = random.Random(self.settings.get('seed'))
+        self._lock = threading.Lock()
+        self._requests = collections.defaultdict(collections.deque)
+        self.text = FakeText(self.settings, self._rng)
+        self.cache_min_tokens = int(self.settings.get('cache_min_tokens', 1024))
+        self._caches = {}
+
+    def model_settings(self, model):
+        models = self.settings.get('models', {}) or {}
+        merged = dict(_DEFAULTS)
+        merged.update(models.get('default', {}) or {})
+        merged.update(models.get(model, {}) or {})
+        return merged
+
+    def _random(self):
+        with self._lock:
+            return self._rng.random()
+
+    def latency(self, model):
+        """Total seconds for one response, drawn from the model's distribution."""
+        spec = self.model_settings(model)['latency_ms']
+        with self._lock:
+            if 'min' in spec:
+                ms = self._rng.uniform(float(spec['min']), float(spec['max']))
+            else:
+                median = float(spec.get('median', 800))
+                sigma = math.log(max(float(spec.get('p95', median)), median) / median) / 1.645
+                ms = self._rng.lognormvariate(math.log(median), sigma)
+        return ms / 1000.0 * self.time_scale
+
+    def _error(self, code, status, message, retry_sec=None):
+        from google.genai import errors
+        details = []
+        if retry_sec is not None:
+            details.append({"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{retry_sec:.1f}s"})
+        body = {"error": {"code": code, "status": status, "message": message, "details": details}}
+        cls = errors.ClientError if code < 500 else errors.ServerError
+        return cls(code, body)
+
+    def admit(self, model):
+        """Applies quota and injected failures. Returns an exception to raise, or None."""
+        spec = self.model_settings(model)
+        rpm = int(spec.get('rpm') or 0)
+        if rpm:
+            now = time.monotonic()
+            window = 60.0 * self.time_scale
+            with self._lock:
+                recent = self._requests[model]
+                while recent and now - recent[0] >= window:
+                    recent.popleft()
+                if len(recent) >= rpm:
+                    wait = window - (now - recent[0])
+                    return self._error(429, "RESOURCE_EXHAUSTED", f"Quota exceeded for {model}: {rpm} requests per minute.", wait)
+                recent.append(now)
+        roll = self._random()
+        if roll < float(spec['rate_429']):
+            return self._error(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota).",
+                               (1 + 4 * self._random()) * self.time_scale)
+        if roll < float(spec['rate_429']) + float(spec['rate_5xx']):
+            return self._error(503, "UNAVAILABLE", "The model is overloaded. Please try again later.")
+        return None
+
+    def create_cache(self, model, config):
+        from google.genai import types
+        system = getattr(config, 'system_instruction', None) or ""
+        text = _prompt_text(getattr(config, 'contents', None) or [])
+        tokens = _tokens(system + text)
+        if tokens < self.cache_min_tokens:
+            raise self._error(400, "INVALID_ARGUMENT", f"Cached content is too small. total_token_count={tokens}, "
+                                                       f"min_total_token_count={self.cache_min_tokens}")
+        ttl = float(str(getattr(config, 'ttl', None) or "3600s").rstrip("s"))
+        with self._lock:
+            name = f"cachedContents/fake-{len(self._caches) + 1}"
+            self._caches[name] = {"model": model, "system": system, "text": text, "tokens": tokens,
+                                  "expires": time.monotonic() + ttl}
+        return types.CachedContent(name=name, model=model, display_name=getattr(config, 'display_name', None))
+
+    def cached(self, name, model=None):
+        """The live cache entry called name (for model), or None."""
+        with self._lock:
+            entry = self._caches.get(name)
+            if entry is not None and entry["expires"] <= time.monotonic():
+                del self._caches[name]
+                entry = None
+        if entry is None or (model is not None and entry["model"] != model):
+            return None
+        return entry
+
+    def delete_cache(self, name):
+        with self._lock:
+            if self._caches.pop(name, None) is None:
+                raise self._error(404, "NOT_FOUND", f"CachedContent not found: {name}")
+
+    def drops(self, model):
+        return self._random() < float(self.model_settings(model)['rate_drop'])
+
+    def plan(self, model, contents, config):
+        """
+        Works out one response: (error or None, delays, chunks). The first
+        delay precedes the first chunk; chunks are SDK response objects.
+        """
+        total = self.latency(model)
+        error = self.admit(model)
+        if error is not None:
+            # Failures come back quicker than answers
+            return error, [total * 0.1], []
+
+        modalities = [str(m).upper() for m in (getattr(config, 'response_modalities', None) or [])]
+        prompt = _prompt_text(contents)
+        system = getattr(config, 'system_instruction', None) or ""
+        cached_tokens = 0
+        cache_name = getattr(config, 'cached_content', None)
+        if cache_name:
+            entry = self.cached(cache_name, model)
+            if entry is None:
+                return self._error(403, "PERMISSION_DENIED", f"CachedContent not found (or permission denied): {cache_name}"), [total * 0.1], []
+            system = entry["system"]
+            prompt = entry["text"] + "\n" + prompt if entry["text"] else prompt
+            cached_tokens = entry["tokens"]
+        seed = zlib.crc32(prompt.encode('utf-8'))
+        if any("IMAGE" in m for m in modalities):
+            data = png_bytes(self.image_size[0], self.image_size[1], seed)
+            return None, [total], [_media_response(data, "image/png")]
+        if any("AUDIO" in m for m in modalities):
+            seconds = max(0.5, len(prompt.split()) / WORDS_PER_SEC)
+            pcm = pcm_bytes(seconds, seed)
+            step = PCM_RATE  # half a second of 16-bit samples per chunk
+            parts = [pcm[i:i + step] for i in range(0, len(pcm), step)]
+            mime = f"audio/L16;codec=pcm;rate={PCM_RATE}"
+            return None, _spread(total, len(parts)), [_media_response(p, mime) for p in parts]
+
+        text = self.text.respond(system, prompt)
+        pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+        chunks = [_text_response(p) for p in pieces]
+        chunks[-1].usage_metadata = _usage(_tokens(system + prompt), cached_tokens, _tokens(text))
+        return None, _spread(total, len(pieces)), chunks
+
+def _spread(total, n):
+    """First chunk after 40% of the latency, the rest evenly after it."""
+    if n <= 1:
+        return [total]
+    first = total * 0.4
+    return [first] + [(total - first) / (n - 1)] * (n - 1)
+
+def _text_response(text):
+    from google.genai import types
+    return types.GenerateContentResponse(candidates=[types.Candidate(
+        content=types.Content(role="model", parts=[types.Part(text=text)]))])
+
+def _usage(prompt_tokens, cached_tokens, output_tokens):
+    from google.genai import types
+    return types.GenerateContentResponseUsageMetadata(
+        prompt_token_count=prompt_tokens,
+        cached_content_token_count=cached_tokens or None,
+        candidates_token_count=output_tokens,
+        total_token_count=prompt_tokens + output_tokens,
+    )
+
+def _media_response(data, mime_type):
+    from google.genai import types
+    return types.GenerateContentResponse(candidates=[types.Candidate(
+        content=types.Content(role="model", parts=[types.Part(inline_data=types.Blob(data=data, mime_type=mime_type))]))])
+
+def _merge(chunks):
+    """Folds streamed chunks into one response, as generate_content returns."""
+    from google.genai import types
+    text = "".join(c.text or "" for c in chunks if c.candidates and c.candidates[0].content.parts[0].text)
+    if text:
+        merged = _text_response(text)
+        merged.usage_metadata = chunks[-1].usage_metadata
+        return merged
+    parts = [p for c in chunks for p in c.candidates[0].content.parts]
+    return types.GenerateContentResponse(candidates=[types.Candidate(content=types.Content(role="model", parts=parts))])
+
+def _dropped_stream():
+    return ConnectionResetError("Fake backend dropped the response stream")
+
+class FakeModels:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def generate_content_stream(self, model, contents, config=None):
+        error, delays, chunks = self._backend.plan(model, contents, config)
+        drop_at = len(chunks) // 2 if len(chunks) > 1 and self._backend.drops(model) else None
+        time.sleep(delays[0])
+        if error is not None:
+            raise error
+        for i, (delay, chunk) in enumerate(zip(delays, chunks)):
+            if i:
+                time.sleep(delay)
+            if i == drop_at:
+                raise _dropped_stream()
+            yield chunk
+
+    def generate_content(self, model, contents, config=None):
+        return _merge(list(self.generate_content_stream(model=model, contents=contents, config=config)))
+
+class AsyncFakeModels:
+    def __init__(self, backend):
+        self._backend = backend
+
+    async def generate_content_stream(self, model, contents, config=None):
+        error, delays, chunks = self._backend.plan(model, contents, config)
+        drop_at = len(chunks) // 2 if len(chunks) > 1 and self._backend.drops(model) else None
+
+        async def stream():
+            await asyncio.sleep(delays[0])
+            if error is not None:
+                raise error
+            for i, (delay, chunk) in enumerate(zip(delays, chunks)):
+                if i:
+                    await asyncio.sleep(delay)
+                if i == drop_at:
+                    raise _dropped_stream()
+                yield chunk
+        return stream()
+
+    async def generate_content(self, model, contents, config=None):
+        stream = await self.generate_content_stream(model=model, contents=contents, config=config)
+        return _merge([chunk async for chunk in stream])
+
+class FakeCaches:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def create(self, model, config=None):
+        return self._backend.create_cache(model, config)
+
+    def delete(self, name, config=None):
+        self._backend.delete_cache(name)
+
+class AsyncFakeCaches:
+    def __init__(self, backend):
+        self._backend = backend
+
+    async def create(self, model, config=None):
+        return self._backend.create_cache(model, config)
+
+    async def delete(self, name, config=None):
+        self._backend.delete_cache(name)
+
+class _Aio:
+    def __init__(self, backend):
+        self.models = AsyncFakeModels(backend)
+        self.caches = AsyncFakeCaches(backend)
+
+class FakeClient:
+    """Drop-in for genai.Client(...) covering the calls utils.google_api makes."""
+    def __init__(self, settings=None):
+        self.backend = FakeBackend(settings)
+        self.models = FakeModels(self.backend)
+        self.caches = FakeCaches(self.backend)
+        self.aio = _Aio(self.backend)
+
+def from_config(config):
+    return FakeClient(config.get('fake_backend', {}))
@@ -0,0 +1,99 @@
+import json
+
+class JsonArrayStream:
+    """
+    Incremental parser for LLM JSON output. Feed it text as it streams in and
+    it returns each element of the array under a top-level key (for example
+    "image_prompts" or "segments") as soon as that element closes.
+
+    Anything before the first '{' (prose, a ```json fence) and after the
+    top-level object closes is ignored, matching how the agents strip fences.
+    """
+    def __init__(self, key):
+        self.key = key
+        self.count = 0
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string = []
+        self._last_string = None
+        self._pending_key = None
+        self._in_target = False
+        self._array_depth = None
+        self._element = []
+
+    def feed(self, text):
+        """Consumes a chunk of text and returns the list of newly completed elements."""
+        completed = []
+        for c in text:
+            if self._finished:
+                break
+            if not self._started:
+                if c == '{':
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            collecting = self._in_target and self._depth >= self._array_depth
+
+            if self._in_string:
+                if collecting:
+                    self._element.append(c)
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._last_string = ''.join(self._string)
+                else:
+                    self._string.append(c)
+                continue
+
+            if c == '"':
+                self._in_string = True
+                self._string = []
+                if collecting:
+                    self._element.append(c)
+            elif c in '{[':
+                if c == '[' and self._depth == 1 and not self._in_target and self._pending_key == self.key:
+                    self._in_target = True
+                    self._array_depth = 2
+                elif collecting:
+                    self._element.append(c)
+                self._depth += 1
+            elif c in '}]':
+                if self._in_target and self._depth == self._array_depth and c == ']':
+                    self._flush(completed)
+                    self._in_target = False
+                elif self._in_target and self._depth > self._array_depth:
+                    self._element.append(c)
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finished = True
+            elif c == ',':
+                if self._in_target and self._depth == self._array_depth:
+                    self._flush(completed)
+                elif collecting:
+                    self._element.append(c)
+                elif self._depth == 1:
+                    self._pending_key = None
+            elif c == ':' and self._depth == 1 and not self._in_target:
+                self._pending_key = self._last_string
+            elif collecting:
+                self._element.append(c)
+        return completed
+
+    def _flush(self, completed):
+        raw = ''.join(self._element).strip()
+        self._element = []
+        if not raw:
+            return
+        try:
+            completed.append(json.loads(raw))
+            self.count += 1
+        except json.JSONDecodeError:
+            # Leave malformed elements to the full parse at the end
+            pass
@@ -0,0 +1,141 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+
+# Disk-backed cache of text responses, keyed by model, prompt hashes and
+# temperature. Shared by every pipeline process on the host through one
+# SQLite file; the least recently used entries are dropped once the stored
+# text passes the configured size.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    model TEXT NOT NULL,
+    system_hash TEXT NOT NULL,
+    user_hash TEXT NOT NULL,
+    temperature REAL NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (model, system_hash, user_hash, temperature)
+);
+CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+def _hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    def __init__(self, db_path, max_mb=256, model_keys=None):
+        self.db_path = db_path
+        self.max_bytes = int(float(max_mb) * 1024 * 1024)
+        self.model_keys = set(model_keys or [])
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        db = self._connect()
+        db.executescript(_SCHEMA)
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def enabled_for(self, model_key):
+        return model_key in self.model_keys
+
+    def _key(self, model, system_prompt, user_prompt, temperature):
+        return (model, _hash(system_prompt), _hash(user_prompt), float(temperature))
+
+    def _count(self, db, name, amount=1):
+        db.execute("INSERT INTO counters VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+                   (name, amount, amount))
+
+    def get(self, model, system_prompt, user_prompt, temperature):
+        """Returns the cached response text, or None on a miss."""
+        key = self._key(model, system_prompt, user_prompt, temperature)
+        with self._transaction() as db:
+            row = db.execute("SELECT response FROM responses WHERE model = ? AND system_hash = ? "
+                             "AND user_hash = ? AND temperature = ?", key).fetchone()
+            if row is None:
+                self._count(db, "misses")
+                return None
+            db.execute("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE model = ? AND system_hash = ? "
+                       "AND user_hash = ? AND temperature = ?", (time.time(),) + key)
+            self._count(db, "hits")
+        return row[0]
+
+    def put(self, model, system_prompt, user_prompt, temperature, response):
+        size = len(response.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        key = self._key(model, system_prompt, user_prompt, temperature)
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                       key + (response, size, now, now))
+            self._evict(db)
+
+    def _evict(self, db):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for rowid, size in db.execute("SELECT rowid, size FROM responses ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM responses WHERE rowid = ?", (rowid,))
+            total -= size
+            evicted += 1
+        self._count(db, "evictions", evicted)
+
+    def stats(self):
+        """Entry count, stored size and lifetime hit/miss/eviction counters."""
+        with self._transaction() as db:
+            entries, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+        return {
+            "entries": entries,
+            "size_mb": size / (1024 * 1024),
+            "max_mb": self.max_bytes / (1024 * 1024),
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+        }
+
+    def clear(self):
+        with self._transaction() as db:
+            db.execute("DELETE FROM responses")
+            db.execute("DELETE FROM counters")
+
+def from_config(config):
+    """Builds the cache from the `llm_cache` section of settings.yaml, or None if disabled."""
+    settings = config.get('llm_cache', {}) or {}
+    if not settings.get('enabled', False) or not settings.get('model_keys'):
+        return None
+    return ResponseCache(
+        db_path=settings.get('db_path', os.path.join('.cache', 'llm_responses.sqlite')),
+        max_mb=settings.get('max_mb', 256),
+        model_keys=settings.get('model_keys', []),
+    )
@@ -1,7 +1,7 @@
 import os
-import soundfile as sf
-from kokoro_onnx import Kokoro
 import json
+from utils.tracing import traced, current_span
+from utils.google_api import get_tts_cache, cached_phrase, store_phrase
 
 # Initialize Kokoro once (global singleton to avoid reloading model)
 _KOKORO = None
@@ -22,14 +22,26 @@ def get_kokoro():
             raise FileNotFoundError(f"Kokoro model not found at {model_path}. Run tools/setup_kokoro.py")
             
         print(f"Loading Kokoro model from {model_path}...")
+        # Imported here so importing this module stays cheap
+        from kokoro_onnx import Kokoro
         # Explicitly use GPU if available
         _KOKORO = Kokoro(model_path, voices_path)
     return _KOKORO
 
+@traced("tts")
 def synthesize_speech_local(text: str, output_path: str, voice_name: str = "af_sky", speed: float = 1.0) -> str:
     """
     Synthesizes speech using local Kokoro ONNX model.
     """
+    call = current_span()
+    call.set(engine="kokoro", model="kokoro-v0_19", voice=voice_name, bytes_in=len(text.encode('utf-8')))
+
+    cache = get_tts_cache()
+    if cache is not None:
+        key, cached = cached_phrase(cache, "kokoro", "kokoro-v0_19", voice_name, speed, text, output_path)
+        if cached:
+            return cached
+
     try:
         kokoro = get_kokoro()
         
@@ -46,11 +58,21 @@ def synthesize_speech_local(text: str, output_path: str, voice_name: str = "af_s
         )
         
         # Save to file
-        sf.write(output_path, samples, sample_rate)
+        import soundfile as sf
+        # Written beside the target and renamed over it, so an existing
+        # hardlink into the TTS cache is replaced rather than overwritten
+        base, ext = os.path.splitext(output_path)
+        tmp_path = base + ".part" + ext
+        sf.write(tmp_path, samples, sample_rate)
+        os.replace(tmp_path, output_path)
+        call.set(bytes_out=os.path.getsize(output_path))
+        if cache is not None:
+            store_phrase(cache, key, output_path)
         return output_path
         
     except Exception as e:
         import traceback
         traceback.print_exc()
         print(f"ERROR in local TTS: {e}")
+        call.fail(e)
         return ""
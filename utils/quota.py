@@ -0,0 +1,159 @@
+import os
+import time
+import sqlite3
+import asyncio
+import threading
+from contextlib import contextmanager
+
+# Per-model token buckets kept in a small SQLite file, so every pipeline
+# process on the host draws from the same budget. Rates adapt AIMD-style:
+# a 429 cuts the model's rate hard, each success adds a little back, up to
+# the configured ceiling.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    model TEXT PRIMARY KEY,
+    rate REAL NOT NULL,      -- current allowed requests per second
+    ceiling REAL NOT NULL,   -- configured requests per second
+    tokens REAL NOT NULL,    -- may go negative: callers queue behind each other
+    updated REAL NOT NULL
+)
+"""
+
+class QuotaGovernor:
+    def __init__(self, db_path, default_rpm=30, model_rpm=None, min_rpm=1,
+                 decrease_factor=0.5, increase_rpm=0.5, burst_sec=2.0):
+        self.db_path = db_path
+        self.default_rpm = float(default_rpm)
+        self.model_rpm = {k: float(v) for k, v in (model_rpm or {}).items()}
+        self.min_rate = float(min_rpm) / 60.0
+        self.decrease_factor = float(decrease_factor)
+        self.increase_rate = float(increase_rpm) / 60.0
+        self.burst_sec = float(burst_sec)
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._transaction() as db:
+            db.execute(_SCHEMA)
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connect()
+        # IMMEDIATE takes the write lock up front, so concurrent processes
+        # serialize on the bucket instead of racing it.
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _ceiling(self, model):
+        return self.model_rpm.get(model, self.default_rpm) / 60.0
+
+    def _load(self, db, model, now):
+        row = db.execute("SELECT rate, ceiling, tokens, updated FROM buckets WHERE model = ?", (model,)).fetchone()
+        ceiling = self._ceiling(model)
+        if row is None:
+            rate, tokens, updated = ceiling, 1.0, now
+            db.execute("INSERT INTO buckets VALUES (?, ?, ?, ?, ?)", (model, rate, ceiling, tokens, updated))
+        else:
+            rate, old_ceiling, tokens, updated = row
+            if old_ceiling != ceiling:
+                # Config changed since the bucket was created
+                rate = min(rate, ceiling)
+        # Refill since the last update, capped at a short burst
+        burst = max(1.0, rate * self.burst_sec)
+        tokens = min(burst, tokens + rate * max(0.0, now - updated))
+        return rate, ceiling, tokens
+
+    def reserve(self, model):
+        """Takes one token for model and returns how long to wait before using it (seconds)."""
+        now = time.time()
+        with self._transaction() as db:
+            rate, ceiling, tokens = self._load(db, model, now)
+            tokens -= 1.0
+            db.execute("UPDATE buckets SET rate = ?, ceiling = ?, tokens = ?, updated = ? WHERE model = ?",
+                       (rate, ceiling, tokens, now, model))
+        return 0.0 if tokens >= 0 else -tokens / rate
+
+    def refund(self, model):
+        """Gives back a token reserved for a request that was never sent."""
+        now = time.time()
+        with self._transaction() as db:
+            rate, ceiling, tokens = self._load(db, model, now)
+            tokens = min(max(1.0, rate * self.burst_sec), tokens + 1.0)
+            db.execute("UPDATE buckets SET rate = ?, ceiling = ?, tokens = ?, updated = ? WHERE model = ?",
+                       (rate, ceiling, tokens, now, model))
+
+    def acquire(self, model):
+        """Blocks until a request to model is allowed. Returns the time waited."""
+        delay = self.reserve(model)
+        if delay > 0:
+            try:
+                time.sleep(delay)
+            except BaseException:
+                self.refund(model)
+                raise
+        return delay
+
+    async def acquire_async(self, model):
+        delay = await asyncio.to_thread(self.reserve, model)
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except BaseException:
+                # Cancelled while queued (a hedge that lost, an interrupted stage)
+                self.refund(model)
+                raise
+        return delay
+
+    def throttled(self, model):
+        """A 429 came back: cut the rate and drop any banked tokens."""
+        now = time.time()
+        with self._transaction() as db:
+            rate, ceiling, tokens = self._load(db, model, now)
+            rate = max(self.min_rate, rate * self.decrease_factor)
+            tokens = min(tokens, 0.0)
+            db.execute("UPDATE buckets SET rate = ?, ceiling = ?, tokens = ?, updated = ? WHERE model = ?",
+                       (rate, ceiling, tokens, now, model))
+        print(f"WARNING: Quota governor lowered {model} to {rate * 60:.1f} requests/min after a rate limit.")
+
+    def succeeded(self, model):
+        """A call went through: creep the rate back towards the ceiling."""
+        now = time.time()
+        with self._transaction() as db:
+            rate, ceiling, tokens = self._load(db, model, now)
+            if rate < ceiling:
+                rate = min(ceiling, rate + self.increase_rate)
+            db.execute("UPDATE buckets SET rate = ?, ceiling = ?, tokens = ?, updated = ? WHERE model = ?",
+                       (rate, ceiling, tokens, now, model))
+
+    def snapshot(self):
+        """Current requests/min per model, for reporting."""
+        with self._transaction() as db:
+            rows = db.execute("SELECT model, rate, ceiling FROM buckets ORDER BY model").fetchall()
+        return {model: {"rpm": rate * 60, "ceiling_rpm": ceiling * 60} for model, rate, ceiling in rows}
+
+def from_config(config):
+    """Builds a governor from the `quota` section of settings.yaml, or None if disabled."""
+    quota = config.get('quota', {}) or {}
+    if not quota.get('enabled', False):
+        return None
+    return QuotaGovernor(
+        db_path=quota.get('db_path', os.path.join('.cache', 'quota.sqlite')),
+        default_rpm=quota.get('default_rpm', 30),
+        model_rpm=quota.get('rpm', {}),
+        min_rpm=quota.get('min_rpm', 1),
+        decrease_factor=quota.get('decrease_factor', 0.5),
+        increase_rpm=quota.get('increase_rpm', 0.5),
+        burst_sec=quota.get('burst_sec', 2.0),
+    )
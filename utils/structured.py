@@ -0,0 +1,234 @@
+import re
+import json
+from utils.tracing import current_span
+from utils.google_api import generate_text
+
+# JSON responses from the agents, made dependable: the schema goes to the
+# model as its response schema, and what comes back is parsed leniently
+# (fences and trailing prose dropped, a truncated document closed off at the
+# last complete value), checked against the schema, and whatever is still
+# missing is asked for on its own instead of rerunning the whole stage.
+
+MAX_REASKS = 2
+
+def _strip_fences(text):
+    if "```json" in text:
+        return text.split("```json", 1)[1].split("```")[0]
+    if "```" in text:
+        return text.split("```")[1]
+    return text
+
+def repair_truncated(text):
+    """
+    Closes a JSON document that was cut off, dropping the incomplete tail
+    back to the last complete value. Returns None if nothing complete is left.
+    """
+    closers = []
+    in_string = False
+    escape = False
+    safe = None
+    for i, c in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif c == '\\':
+                escape = True
+            elif c == '"':
+                in_string = False
+            continue
+        if c == '"':
+            in_string = True
+        elif c in '{[':
+            closers.append('}' if c == '{' else ']')
+        elif c in '}]' and closers:
+            closers.pop()
+            if not closers:
+                return text[:i + 1]
+            safe = (i + 1, ''.join(reversed(closers)))
+        elif c == ',' and closers:
+            safe = (i, ''.join(reversed(closers)))
+    if safe is None:
+        return None
+    return text[:safe[0]] + safe[1]
+
+def parse_json(text):
+    """
+    Lenient parse of a model's JSON answer. Returns (data, truncated);
+    data is None when nothing usable could be recovered.
+    """
+    body = _strip_fences(text or "")
+    start = body.find("{")
+    if start < 0:
+        return None, False
+    body = body[start:]
+    try:
+        # raw_decode stops at the end of the object, ignoring trailing prose
+        return json.JSONDecoder().raw_decode(body)[0], False
+    except ValueError:
+        pass
+
+    # Trailing commas, then truncation
+    cleaned = re.sub(r",\s*([}\]])", r"\1", body)
+    try:
+        return json.JSONDecoder().raw_decode(cleaned)[0], False
+    except ValueError:
+        pass
+    repaired = repair_truncated(cleaned)
+    if repaired is None:
+        return None, True
+    try:
+        return json.loads(re.sub(r",\s*([}\]])", r"\1", repaired)), True
+    except ValueError:
+        return None, True
+
+def _type_ok(value, expected):
+    if isinstance(expected, list):
+        return any(_type_ok(value, t) for t in expected)
+    if expected == "object":
+        return isinstance(value, dict)
+    if expected == "array":
+        return isinstance(value, list)
+    if expected == "string":
+        return isinstance(value, str)
+    if expected == "boolean":
+        return isinstance(value, bool)
+    if expected == "integer":
+        return isinstance(value, int) and not isinstance(value, bool) or isinstance(value, float) and value.is_integer()
+    if expected == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if expected == "null":
+        return value is None
+    return True
+
+def validate(data, schema, path=""):
+    """Problems with data against the schema subset we use (type, required, properties, items)."""
+    problems = []
+    expected = schema.get("type")
+    if expected and not _type_ok(data, expected):
+        return [f"{path or 'response'}: expected {expected}"]
+    if isinstance(data, dict):
+        for key in schema.get("required", []):
+            if key not in data:
+                problems.append(f"{path}.{key}: missing" if path else f"{key}: missing")
+        for key, sub in schema.get("properties", {}).items():
+            if key in data:
+                problems.extend(validate(data[key], sub, f"{path}.{key}" if path else key))
+    elif isinstance(data, list) and "items" in schema:
+        for i, item in enumerate(data):
+            problems.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return problems
+
+def _note(key):
+    call = current_span()
+    if call is not None:
+        call.add(key, 1)
+
+def _ask(system_prompt, user_prompt, note, schema, model_key, temperature, shared_context=None):
+    _note("reasks")
+    response = generate_text(
+        system_prompt=system_prompt,
+        user_prompt=f"{user_prompt}\n\n{note}",
+        model_key=model_key,
+        temperature=temperature,
+        response_schema=schema,
+        shared_context=shared_context
+    )
+    data, _ = parse_json(response)
+    return data
+
+def complete_json(text, system_prompt, user_prompt, schema, model_key="text_main", temperature=0.7,
+                  list_key=None, id_field=None, expected_ids=None, label="response", shared_context=None):
+    """
+    Turns a model's answer into a document that satisfies schema. Repairs
+    what can be repaired locally; then re-asks only for the missing part:
+    missing top-level keys, or the entries of data[list_key] (identified by
+    id_field) that were lost to truncation or came back invalid. Returns the
+    best document it has, or None if nothing usable was recovered.
+    """
+    data, truncated = parse_json(text)
+    if truncated and data is not None:
+        print(f"WARNING: {label} was cut off; kept the complete part")
+        _note("repairs")
+
+    if not isinstance(data, dict):
+        print(f"WARNING: {label} was not valid JSON; asking again")
+        data = _ask(system_prompt, user_prompt,
+                    "Your previous answer could not be parsed. Reply with the JSON object only.",
+                    schema, model_key, temperature, shared_context)
+        truncated = False
+        if not isinstance(data, dict):
+            return None
+
+    item_schema = schema.get("properties", {}).get(list_key, {}).get("items", {}) if list_key else {}
+    for _ in range(MAX_REASKS):
+        # Invalid list entries are dropped and asked for again by id
+        if list_key and isinstance(data.get(list_key), list):
+            kept = [item for item in data[list_key] if not validate(item, item_schema)]
+            if len(kept) != len(data[list_key]):
+                print(f"WARNING: {label}: dropped {len(data[list_key]) - len(kept)} malformed {list_key} entries")
+                data[list_key] = kept
+
+        problems = [p for p in validate(data, schema) if not (list_key and p.startswith(f"{list_key}["))]
+        missing_keys = [k for k in schema.get("required", []) if k not in data]
+
+        missing_ids = []
+        if list_key and id_field and expected_ids:
+            have = {item.get(id_field) for item in data.get(list_key) or []}
+            missing_ids = [i for i in expected_ids if i not in have]
+        cut_short = truncated and list_key and not expected_ids
+
+        if not problems and not missing_ids and not cut_short:
+            return data
+
+        if missing_ids or cut_short:
+            part_schema = {"type": "object", "properties": {list_key: schema["properties"][list_key]}, "required": [list_key]}
+            if missing_ids:
+                note = (f"Your previous answer is missing these {list_key} entries ({id_field}): {', '.join(map(str, missing_ids))}. "
+                        f"Reply ONLY with a JSON object {{\"{list_key}\": [...]}} containing exactly those entries.")
+            else:
+                last = (data.get(list_key) or [{}])[-1].get(id_field, "the last complete entry") if data.get(list_key) else "the start"
+                note = (f"Your previous answer was cut off after {id_field} {last}. "
+                        f"Reply ONLY with a JSON object {{\"{list_key}\": [...]}} containing the remaining entries after it.")
+            print(f"WARNING: {label}: asking again for {len(missing_ids) or 'the remaining'} {list_key} entries")
+            extra = _ask(system_prompt, user_prompt, note, part_schema, model_key, temperature, shared_context)
+            if isinstance(extra, dict) and isinstance(extra.get(list_key), list):
+                have = {item.get(id_field) for item in data.get(list_key) or []} if id_field else set()
+                wanted = set(missing_ids)
+                for item in extra[list_key]:
+                    if not isinstance(item, dict) or validate(item, item_schema):
+                        continue
+                    key = item.get(id_field) if id_field else None
+                    if id_field and (key in have or (wanted and key not in wanted)):
+                        continue
+                    data.setdefault(list_key, []).append(item)
+                    have.add(key)
+            truncated = False
+        elif missing_keys or problems:
+            keys = missing_keys or sorted({p.split(".")[0].split("[")[0].split(":")[0] for p in problems})
+            part_schema = {"type": "object",
+                           "properties": {k: schema["properties"][k] for k in keys if k in schema.get("properties", {})},
+                           "required": keys}
+            note = (f"Your previous answer had problems: {'; '.join(problems[:10])}. "
+                    f"Reply ONLY with a JSON object containing corrected values for: {', '.join(keys)}.")
+            print(f"WARNING: {label}: asking again for {', '.join(keys)}")
+            extra = _ask(system_prompt, user_prompt, note, part_schema, model_key, temperature, shared_context)
+            if isinstance(extra, dict):
+                data.update({k: v for k, v in extra.items() if k in keys})
+
+    remaining = validate(data, schema)
+    if remaining:
+        print(f"WARNING: {label} still has {len(remaining)} schema problems after re-asking; using it as is")
+    return data
+
+def generate_json(system_prompt, user_prompt, schema, model_key="text_main", temperature=0.7, shared_context=None, **kwargs):
+    """generate_text() in JSON mode with schema, followed by complete_json()."""
+    response = generate_text(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        model_key=model_key,
+        temperature=temperature,
+        response_schema=schema,
+        shared_context=shared_context
+    )
+    return complete_json(response, system_prompt, user_prompt, schema, model_key, temperature,
+                         shared_context=shared_context, **kwargs)
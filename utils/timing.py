@@ -0,0 +1,196 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Segment and visual slot times, computed locally. The structure agent only
+# asks the model which paragraphs and visuals belong to each segment; the
+# seconds come from the paragraphs' word counts at the narration voice's
+# speaking rate. Rates start from settings.yaml and are calibrated from the
+# measured length of every episode's synthesized narration.
+
+# Length given to a segment with no narration mapped to it
+EMPTY_SEGMENT_SEC = 5.0
+
+_HEADER = re.compile(r"^\W*\[(\d)\]\s+[A-Z][A-Z0-9 ,&()/:'-]*\W*$")
+_DIRECTION = re.compile(r"\[[^\]]*\]")
+_WORD = re.compile(r"[\w'’-]+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS voice_rates (
+    voice TEXT PRIMARY KEY,
+    words REAL NOT NULL,
+    seconds REAL NOT NULL,
+    samples INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+def narration_paragraphs(script):
+    """
+    Paragraphs of the script's FULL VOICE-OVER SCRIPT section ([3]), in
+    reading order. The whole text is used when the section can't be found.
+    """
+    lines = (script or "").splitlines()
+    start, end = 0, len(lines)
+    for i, line in enumerate(lines):
+        match = _HEADER.match(line.strip())
+        if not match:
+            continue
+        if match.group(1) == "3":
+            start = i + 1
+        elif start and i >= start:
+            end = i
+            break
+
+    paragraphs = []
+    block = []
+    for line in lines[start:end] + [""]:
+        if line.strip():
+            block.append(line.strip())
+        elif block:
+            text = " ".join(block)
+            if word_count(text):
+                paragraphs.append(text)
+            block = []
+    return paragraphs
+
+def word_count(text):
+    """Spoken words in text; bracketed directions ("[PAUSE]") don't count."""
+    return len(_WORD.findall(_DIRECTION.sub(" ", text or "")))
+
+def voice_key(config):
+    """The narration voice as calibrated: TTS model, voice name and speed."""
+    tts = config.get('tts', {})
+    model = config['models'].get('tts_model', '')
+    return f"{model}/{tts.get('voice_name', '')}@{float(tts.get('speaking_rate', 1.0) or 1.0):g}"
+
+class VoiceRates:
+    """Measured words and seconds of narration per voice, shared by every pipeline process on this host."""
+    def __init__(self, db_path, decay=0.9):
+        self.db_path = db_path
+        self.decay = float(decay)
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def record(self, voice, words, seconds):
+        """Adds an episode's narration; earlier episodes are weighted down by decay."""
+        if words <= 0 or seconds <= 0:
+            return
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO voice_rates VALUES (?, ?, ?, 1, ?) ON CONFLICT(voice) DO UPDATE SET "
+                "words = words * ? + excluded.words, seconds = seconds * ? + excluded.seconds, "
+                "samples = samples + 1, updated = excluded.updated",
+                (voice, float(words), float(seconds), time.time(), self.decay, self.decay)
+            )
+
+    def get(self, voice):
+        """(words, seconds) recorded for voice, or None."""
+        row = self._connect().execute("SELECT words, seconds FROM voice_rates WHERE voice = ?", (voice,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+def voice_rates(config):
+    """
+    The calibration store from the `timing` section of settings.yaml, or
+    None if disabled. Mock and fake runs don't use it: their narration says
+    nothing about the real voice.
+    """
+    settings = (config.get('timing', {}) or {}).get('calibration', {}) or {}
+    runtime = config.get('runtime', {})
+    if not settings.get('enabled', False) or runtime.get('mock_mode') or runtime.get('backend', 'genai') != 'genai':
+        return None
+    try:
+        return VoiceRates(settings.get('db_path', '.cache/voice_rates.sqlite'), settings.get('decay', 0.9))
+    except sqlite3.Error as e:
+        print(f"WARNING: Voice rate calibration unavailable ({e})")
+        return None
+
+def words_per_sec(config, rates=None):
+    """
+    Speaking rate of the configured narration voice: its calibrated rate
+    once enough narration has been measured, else the configured words per
+    minute for the voice, scaled by the TTS speed.
+    """
+    settings = config.get('timing', {}) or {}
+    voice = voice_key(config)
+    measured = rates.get(voice) if rates is not None else None
+    if measured and measured[1] >= float((settings.get('calibration', {}) or {}).get('min_sec', 60)):
+        return measured[0] / measured[1], "calibrated"
+
+    tts = config.get('tts', {})
+    wpm = (settings.get('voices', {}) or {}).get(tts.get('voice_name'), settings.get('words_per_minute', 155))
+    return float(wpm) / 60.0 * float(tts.get('speaking_rate', 1.0) or 1.0), "configured"
+
+def _paragraph_range(seg, count):
+    ref = seg.get('narration_ref') or {}
+    try:
+        first = int(ref.get('from_paragraph_index'))
+        last = int(ref.get('to_paragraph_index', first))
+    except (TypeError, ValueError):
+        return range(0)
+    return range(max(first, 0), min(last, count - 1) + 1)
+
+def _place_slots(seg):
+    slots = seg.get('visual_slots') or []
+    start, end = seg['start_time_sec'], seg['end_time_sec']
+    for i, slot in enumerate(slots):
+        slot['start_time_sec'] = round(start + (end - start) * i / len(slots), 2)
+        slot['end_time_sec'] = round(start + (end - start) * (i + 1) / len(slots), 2)
+
+def _place_ad_breaks(structure):
+    ends = {seg.get('id'): seg['end_time_sec'] for seg in structure.get('segments', [])}
+    for suggestion in structure.get('ad_break_suggestions') or []:
+        if suggestion.get('after_segment_id') in ends:
+            suggestion['time_sec'] = ends[suggestion['after_segment_id']]
+
+def apply_times(structure, seconds_by_segment):
+    """
+    Lays the structure's segments back to back at the given lengths (by id)
+    and spreads each segment's visual slots evenly over it. In place.
+    """
+    cursor = 0.0
+    for seg in structure.get('segments', []):
+        seg['start_time_sec'] = round(cursor, 2)
+        cursor += seconds_by_segment.get(seg.get('id'), 0.0)
+        seg['end_time_sec'] = round(cursor, 2)
+        _place_slots(seg)
+    _place_ad_breaks(structure)
+    structure['total_estimated_minutes'] = round(cursor / 60.0, 2)
+    return structure
+
+def estimate_times(structure, script, words_per_second, paragraph_pause_sec=0.4):
+    """Times for a structure from the word counts of the script paragraphs each segment narrates."""
+    paragraphs = narration_paragraphs(script)
+    seconds = {}
+    for seg in structure.get('segments', []):
+        indices = _paragraph_range(seg, len(paragraphs))
+        words = sum(word_count(paragraphs[i]) for i in indices)
+        if not words:
+            print(f"WARNING: Segment {seg.get('id')} has no narration mapped to it; giving it {EMPTY_SEGMENT_SEC:.0f}s")
+            seconds[seg.get('id')] = EMPTY_SEGMENT_SEC
+            continue
+        seconds[seg.get('id')] = words / words_per_second + paragraph_pause_sec * len(indices)
+    return apply_times(structure, seconds)
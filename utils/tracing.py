@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+import functools
+import inspect
+from contextlib import contextmanager
+
+# The active tracer and span travel with the context, so worker threads
+# started through run_in_context() and asyncio tasks attach their spans to
+# the right episode and parent.
+_TRACER = contextvars.ContextVar("tracer", default=None)
+_SPAN = contextvars.ContextVar("span", default=None)
+
+TRACE_FILE = "trace.jsonl"
+
+class Tracer:
+    """Appends finished spans for one episode run to a JSONL file."""
+    def __init__(self, path, episode=None):
+        self.path = path
+        self.episode = episode
+        self.run_id = uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def write(self, record):
+        record["run_id"] = self.run_id
+        if self.episode:
+            record["episode"] = self.episode
+        line = json.dumps(record, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+class Span:
+    def __init__(self, name, kind, attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.kind = kind
+        self.attrs = attrs
+        self.parent = _SPAN.get()
+        self.error = None
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, key, amount=1):
+        """Increments a numeric attribute such as retries or bytes_out."""
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self._t0) * 1000, 3)
+
+    def fail(self, error):
+        """Marks the span as failed when the error is handled rather than raised."""
+        self.error = error
+
+    def to_record(self, status, error=None):
+        error = error if error is not None else self.error
+        if error is not None:
+            status = "error"
+        elapsed = time.perf_counter() - self._t0
+        record = {
+            "span_id": self.id,
+            "parent_id": self.parent.id if self.parent else None,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "end": self.start + elapsed,
+            "duration_ms": round(elapsed * 1000, 3),
+            "status": status,
+        }
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
+        record.update(self.attrs)
+        return record
+
+@contextmanager
+def span(name, kind="internal", **attrs):
+    """
+    Records a timed span around the enclosed block. Works without an active
+    tracer too, so instrumented code never has to check.
+    """
+    current = Span(name, kind, attrs)
+    token = _SPAN.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        _SPAN.reset(token)
+        _finish(current, "error", e)
+        raise
+    _SPAN.reset(token)
+    _finish(current, "ok")
+
+def _finish(current, status, error=None):
+    tracer = _TRACER.get()
+    if tracer is not None:
+        tracer.write(current.to_record(status, error))
+
+@contextmanager
+def detached_span(name, kind="internal", **attrs):
+    """
+    Like span(), but does not become the current span. Use it inside
+    generators, where setting the context variable would leak into the
+    consumer's code between yields.
+    """
+    current = Span(name, kind, attrs)
+    try:
+        yield current
+    except BaseException as e:
+        _finish(current, "error", e)
+        raise
+    _finish(current, "ok")
+
+def traced(kind, name=None):
+    """Decorator form of span(); the function can enrich it via current_span()."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name or func.__name__, kind=kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__, kind=kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def current_span():
+    """Returns the innermost open span, or None."""
+    return _SPAN.get()
+
+@contextmanager
+def use_tracer(tracer):
+    token = _TRACER.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _TRACER.reset(token)
+
+def episode_tracer(episode_root, episode=None):
+    return Tracer(os.path.join(episode_root, TRACE_FILE), episode=episode)
+
+def run_in_context(executor, fn, *args):
+    """executor.submit() that carries the caller's tracer and span into the worker."""
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, fn, *args)
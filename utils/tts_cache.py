@@ -0,0 +1,143 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+import unicodedata
+from contextlib import contextmanager
+from utils.asset_store import content_key, link_or_copy
+
+# Synthesized narration shared across episodes and TTS engines. Audio files
+# live under <root>/<xx>/<key><ext> and are hardlinked into episodes; a small
+# SQLite index beside them tracks size, last use and hits, so the cache can
+# be held under a size cap (least recently used phrases go first).
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS phrases (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS phrases_lru ON phrases (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+def normalize_text(text):
+    """Folds differences that don't change the spoken result (unicode forms, whitespace)."""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def phrase_key(engine, model, voice_name, speed, text):
+    return content_key(engine=engine, model=model, voice=voice_name,
+                       speed=float(speed), text=normalize_text(text))
+
+class PhraseCache:
+    def __init__(self, root, max_mb=2048):
+        self.root = root
+        self.max_bytes = int(float(max_mb) * 1024 * 1024)
+        self._local = threading.local()
+
+        os.makedirs(root, exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(os.path.join(self.root, "index.sqlite"), timeout=30, isolation_level=None)
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _count(self, db, name, amount=1):
+        db.execute("INSERT INTO counters VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+                   (name, amount, amount))
+
+    def fetch(self, key, output_path):
+        """
+        Links the cached audio for key to output_path (with the cached file's
+        extension) and returns the path used, or None on a miss.
+        """
+        with self._transaction() as db:
+            row = db.execute("SELECT path FROM phrases WHERE key = ?", (key,)).fetchone()
+            if row is not None and not os.path.exists(row[0]):
+                # Removed behind our back
+                db.execute("DELETE FROM phrases WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self._count(db, "misses")
+                return None
+            db.execute("UPDATE phrases SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+            self._count(db, "hits")
+
+        final_path = os.path.splitext(output_path)[0] + os.path.splitext(row[0])[1]
+        link_or_copy(row[0], final_path)
+        return final_path
+
+    def add(self, key, path):
+        """Adopts freshly synthesized audio, evicting old phrases past the size cap."""
+        size = os.path.getsize(path)
+        if size > self.max_bytes:
+            return
+        stored = os.path.join(self.root, key[:2], key + os.path.splitext(path)[1].lower())
+        link_or_copy(path, stored)
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO phrases VALUES (?, ?, ?, ?, ?, 0)", (key, stored, size, now, now))
+            self._evict(db)
+
+    def _evict(self, db):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM phrases").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, path, size in db.execute("SELECT key, path, size FROM phrases ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM phrases WHERE key = ?", (key,))
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+            evicted += 1
+        self._count(db, "evictions", evicted)
+
+    def stats(self):
+        """Phrase count, stored size and lifetime hit/miss/eviction counters."""
+        with self._transaction() as db:
+            entries, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM phrases").fetchone()
+            counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+        return {
+            "entries": entries,
+            "size_mb": size / (1024 * 1024),
+            "max_mb": self.max_bytes / (1024 * 1024),
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+        }
+
+def from_config(config):
+    """Builds the cache from the `tts_cache` section of settings.yaml, or None if disabled."""
+    settings = config.get('tts_cache', {}) or {}
+    if not settings.get('enabled', False):
+        return None
+    return PhraseCache(
+        root=settings.get('root', os.path.join('.cache', 'tts')),
+        max_mb=settings.get('max_mb', 2048),
+    )